@@ -0,0 +1,236 @@
+""" Batch analytics over the stored charging histories of many runs.
+
+    stack = RunStack.from_store(ResultsStore(getRESULTS_DB()), site='jpl', tariff='sce_tou_ev_4_march_2019', revenue=0.3)
+    stack.summary(time_month=time_month)    # getDFResult-like table, computed from the arrays
+    stack.daily_peaks(), stack.tou_breakdown(), stack.session_shortfall(), stack.profiles(), stack.daily_profile()
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytz
+
+import templates
+from sim_reader import SimResult
+from event_store import sample_days
+from utility import _get_event_store, getEVENTS_DIR
+
+RUN_COLUMNS = ['scenario', 'alg', 'start', 'end', 'tariff', 'revenue']
+THRESHOLD   = 0.1   # kWh, see analysis.proportion_of_demands_met
+
+
+def _run_config(path):
+    """ Run configuration of a stored run from its run key, {} for runs stored without one. """
+    try:
+        with open(os.path.join(path, 'run_key.json')) as f:
+            return json.load(f)['config']
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+class RunStack:
+    """ Charging histories of many runs of one site stacked into a single (run, station, time) array.
+
+    Runs are aligned on their own start and zero-padded to the longest one, so time index t is the t-th period
+    of every run. All runs must share the station order and the simulation period. `runs` holds one row per
+    run with the results-store columns, in the order of the first axis.
+    """
+    def __init__(self, runs, rates, station_ids, period, site, voltage=208):
+        self.runs           = runs.reset_index(drop=True)
+        self.rates          = rates
+        self.station_ids    = station_ids
+        self.period         = period
+        self.site           = site
+        network             = templates.network(site, voltage=voltage)
+        index               = {station_id: i for i, station_id in enumerate(network.station_ids)}
+        self.voltages       = np.asarray(network._voltages, dtype=float)[[index[s] for s in station_ids]]
+        self._sessions      = None
+
+    @classmethod
+    def from_runs(cls, runs, site, voltage=208, dtype=np.float32):
+        """ Stack the runs in `runs`, a DataFrame with a path column such as ResultsStore.query() returns. """
+        runs    = runs[[SimResult(path).exists() or os.path.exists(os.path.join(path, 'charging_rates.npy'))
+                        for path in runs['path']]].reset_index(drop=True)
+        if not len(runs):
+            raise ValueError('No stored runs to stack')
+        results = [SimResult(path) for path in runs['path']]
+        periods = {_run_config(path).get('period', 5) for path in runs['path']}
+        if len(periods) > 1:
+            raise ValueError(f'Runs with different periods {sorted(periods)} cannot be stacked')
+        station_ids = results[0].station_ids
+        length  = max(result.charging_rates.shape[1] for result in results)
+        rates   = np.zeros((len(results), len(station_ids), length), dtype=dtype)
+        for i, result in enumerate(results):
+            if not np.array_equal(result.station_ids, station_ids):
+                raise ValueError(f'{result.path} has a different station order')
+            rates[i, :, :result.charging_rates.shape[1]] = result.charging_rates
+        return cls(runs, rates, np.asarray(station_ids), periods.pop(), site, voltage)
+
+    @classmethod
+    def from_store(cls, store, site, voltage=208, **filters):
+        """ Stack every run of `site` in a ResultsStore matching the query filters. """
+        return cls.from_runs(store.query(site=site, **filters), site, voltage)
+
+    def __len__(self):
+        return len(self.runs)
+
+    @property
+    def per_day(self):
+        return 24 * 60 // self.period
+
+    def _starts(self):
+        return [datetime.strptime(start, '%Y-%m-%d') for start in self.runs['start']]
+
+    def aggregate_current(self):
+        """ (run, time) aggregate current in A. """
+        return self.rates.sum(axis=1, dtype=float)
+
+    def power(self):
+        """ (run, time) aggregate power in kW. """
+        return np.einsum('rst,s->rt', self.rates, self.voltages) / 1000
+
+    def prices(self):
+        """ (run, time) ToU energy price in $/kWh of every run's tariff and dates. """
+        days = -(-self.rates.shape[2] // self.per_day)
+        return np.stack([templates.tariff(tariff, start, days, self.period).prices[:self.rates.shape[2]]
+                         for tariff, start in zip(self.runs['tariff'], self._starts())])
+
+    def _by_day(self, array):
+        """ Reshape (run, time) to (run, day, period of day), padding the last day with zeros. """
+        days = -(-array.shape[1] // self.per_day)
+        padded = np.zeros((array.shape[0], days * self.per_day))
+        padded[:, :array.shape[1]] = array
+        return padded.reshape(array.shape[0], days, self.per_day)
+
+    def daily_peaks(self):
+        """ Tidy per-run, per-day peak current (A), peak power (kW) and the time of day of the peak. """
+        current, power = self._by_day(self.aggregate_current()), self._by_day(self.power())
+        runs, days = np.meshgrid(np.arange(len(self)), np.arange(current.shape[1]), indexing='ij')
+        df = pd.DataFrame({
+            'run'           : runs.ravel(),
+            'day'           : days.ravel(),
+            'peak_current'  : current.max(axis=2).ravel(),
+            'peak_kw'       : power.max(axis=2).ravel(),
+            'peak_time'     : pd.to_timedelta(current.argmax(axis=2).ravel() * self.period, unit='min'),
+        })
+        df['date'] = [start + timedelta(days=int(day)) for start, day in zip(np.array(self._starts())[df['run']], df['day'])]
+        return self.runs[RUN_COLUMNS].iloc[df['run']].reset_index(drop=True).join(df)
+
+    def tou_breakdown(self):
+        """ Tidy per-run energy (kWh) and cost ($) at every price level of the tariff. """
+        energy = self.power() * self.period / 60
+        prices = self.prices()
+        rows = []
+        for level in np.unique(prices):
+            at_level = prices == level
+            rows.append(pd.DataFrame({'run': np.arange(len(self)), 'price': level,
+                                      'energy': np.where(at_level, energy, 0).sum(axis=1),
+                                      'periods': at_level.sum(axis=1)}))
+        df = pd.concat(rows, ignore_index=True).sort_values(['run', 'price'], ignore_index=True)
+        df['cost'] = df['energy'] * df['price']
+        return self.runs[RUN_COLUMNS].iloc[df['run']].reset_index(drop=True).join(df)
+
+    def session_shortfall(self, events_fn=None):
+        """ Tidy per-session requested, delivered and unmet energy (kWh) of every run.
+
+        Delivered energy comes from the stacked charging rates over each session's stay, so no simulator is
+        deserialized. `events_fn(run_row)` returns the EventStore of a run; by default the cached event store
+        of its site, dates and scenario is used.
+        """
+        if self._sessions is not None and events_fn is None:
+            return self._sessions
+        events_fn   = events_fn or self._default_events
+        index       = {station_id: i for i, station_id in enumerate(self.station_ids)}
+        # delivered energy in [arrival, departure) as a difference of the cumulative energy per station
+        energy      = self.rates * (self.voltages[None, :, None] * self.period / 60 / 1000)
+        cumulative  = np.concatenate([np.zeros(energy.shape[:2] + (1,)), np.cumsum(energy, axis=2, dtype=float)], axis=2)
+        frames = []
+        for i, row in self.runs.iterrows():
+            eventStore  = events_fn(row)
+            records     = eventStore.records
+            stations    = np.array([index[s] for s in eventStore.stations])[records['station_index']]
+            arrival     = np.clip(records['arrival'], 0, cumulative.shape[2] - 1)
+            departure   = np.clip(records['departure'], 0, cumulative.shape[2] - 1)
+            delivered   = cumulative[i, stations, departure] - cumulative[i, stations, arrival]
+            frames.append(pd.DataFrame({'run': i, 'session_id': records['session_id'],
+                                        'requested': records['requested_energy'], 'delivered': delivered}))
+        df = pd.concat(frames, ignore_index=True)
+        df['shortfall'] = np.maximum(df['requested'] - df['delivered'], 0)
+        df = self.runs[RUN_COLUMNS].iloc[df['run']].reset_index(drop=True).join(df)
+        if events_fn == self._default_events:
+            self._sessions = df
+        return df
+
+    def _default_events(self, row):
+        """ The events a run simulated: the cached event store at the run's own event period and voltage, resampled
+        to the sampled days and coarse period of screening runs. """
+        config      = _run_config(row['path'])
+        fidelity    = config.get('options', {}).get('fidelity')
+        if fidelity is None and f'{os.sep}Screening{os.sep}' in row['path']:
+            raise ValueError(f'{row["path"]} is a screening run stored without its fidelity, pass events_fn')
+        period      = fidelity['events_period'] if fidelity else config.get('period', self.period)
+        start, end  = datetime.strptime(row['start'], '%Y-%m-%d'), datetime.strptime(row['end'], '%Y-%m-%d')
+        eventStore  = _get_event_store(self.site, pytz.timezone('America/Los_Angeles'), getEVENTS_DIR(self.site), start, end,
+                                       period, config.get('voltage', 208), demand_name=row['scenario'])
+        if fidelity:
+            days = sample_days((end - start).days, fidelity['days'], fidelity['seed'])
+            eventStore = eventStore.resample(period, fidelity['period'], days)
+        return eventStore
+
+    def summary(self, time_month=None, events_fn=None):
+        """ getDFResult-like table computed from the stacked arrays, plus load-profile statistics.
+
+        Every run is priced at its own revenue per kWh, the revenue column of `runs`; the dollar revenue is
+        revenue_usd, so stacks of several revenue levels keep their revenue as a grouping key.
+
+        Args:
+            time_month (dict): Month name -> [start, end] as in experiment.py, used as the index like getDFResult.
+            events_fn: See session_shortfall(). Session metrics fall back to the stored ones if no events load.
+        """
+        power   = self.power()
+        current = self.aggregate_current()
+        energy  = power * self.period / 60
+        peaks   = self._by_day(current).max(axis=2)
+        df = self.runs[RUN_COLUMNS].copy()
+        df['peak_current']              = current.max(axis=1)
+        df['total_energy_delivered']    = energy.sum(axis=1)
+        df['energy_cost']               = (energy * self.prices()).sum(axis=1)
+        df['demand_charge']             = [templates.tariff(tariff, start, 1, self.period).get_demand_charge(start) * peak
+                                           for tariff, start, peak in zip(df['tariff'], self._starts(), power.max(axis=1))]
+        df['mean_daily_peak']           = peaks.mean(axis=1)
+
+        try:
+            sessions = self.session_shortfall(events_fn).groupby('run')
+            df['total_energy_requested']    = sessions['requested'].sum()
+            df['proportion_delivered']      = df['total_energy_delivered'] / df['total_energy_requested'] * 100
+            df['demands_fully_met']         = sessions['shortfall'].apply(lambda s: (s < THRESHOLD).mean() * 100)
+            df['unmet_p50']                 = sessions['shortfall'].quantile(0.5)
+            df['unmet_p90']                 = sessions['shortfall'].quantile(0.9)
+        except Exception as e:
+            print(f'Session metrics from the results store, events not available: {e}')
+            for column in ['total_energy_requested', 'proportion_delivered', 'demands_fully_met']:
+                df[column] = self.runs[column]
+
+        df['revenue_usd']   = df['total_energy_delivered'] * self.runs['revenue'].astype(float)
+        df['total_cost']    = df['demand_charge'] + df['energy_cost']
+        df['profit']        = df['revenue_usd'] - df['total_cost']
+        df['cost_per_kwh']  = df['total_cost'] / df['total_energy_delivered']
+        if time_month is not None:
+            months = {str(day[0].date()): month for month, day in time_month.items()}
+            df['month'] = [months.get(start) for start in df['start']]
+            df = df.set_index('month')
+        return df
+
+    def profiles(self):
+        """ Time-resolved aggregate current (A), one column per run, indexed by the time since the run start. """
+        index = pd.to_timedelta(np.arange(self.rates.shape[2]) * self.period, unit='min')
+        columns = pd.MultiIndex.from_frame(self.runs[RUN_COLUMNS])
+        return pd.DataFrame(self.aggregate_current().T, index=index, columns=columns)
+
+    def daily_profile(self):
+        """ Mean aggregate current (A) by time of day, one column per run. """
+        index = pd.to_timedelta(np.arange(self.per_day) * self.period, unit='min')
+        columns = pd.MultiIndex.from_frame(self.runs[RUN_COLUMNS])
+        return pd.DataFrame(self._by_day(self.aggregate_current()).mean(axis=1).T, index=index, columns=columns)
@@ -2,8 +2,10 @@ import os
 import json
 from acnportal import acnsim
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 
 from config import *
+from sim_reader import SimResult, find_sim_json, open_sim_json
 
 def get_metric(results_dir, config):
     path = os.path.join(results_dir, f"{config['start']}_{config['end']}", config['tariff'], str(config['revenue']), config['scenario'], config['alg']
@@ -26,44 +28,80 @@ def get_solve_stats(results_dir, config):
         return json.load(f)
 
 def get_sim(results_dir, config):
-    path = os.path.join(results_dir, f"{config['start']}_{config['end']}", config['tariff'], str(config['revenue']), config['scenario'], config['alg']
-    , 'sim.json')
+    path = find_sim_json(os.path.join(results_dir, f"{config['start']}_{config['end']}", config['tariff'], str(config['revenue']), config['scenario'], config['alg']))
 
-    if not os.path.exists(path):
+    if path is None:
         return None
-    with open(path) as f:
+    with open_sim_json(path) as f:
         try:
             return acnsim.Simulator.from_json(f)
         except:
             print(path)
             
-def getDFResult(scenarios, time_month, algs):
-    data = []
-    col_show = ['alg','proportion_delivered','demands_fully_met','peak_current','total_energy_delivered','total_energy_requested','revenue','demand_charge','energy_cost','profit']
+def get_sim_result(results_dir, config):
+    """ Lazy alternative to get_sim: arrays are memory-mapped, the Simulator is only built on demand. """
+    path = os.path.join(results_dir, f"{config['start']}_{config['end']}", config['tariff'], str(config['revenue']), config['scenario'], config['alg'])
+    result = SimResult(path)
+    if not result.exists():
+        return None
+    return result
+
+COL_SHOW = ['alg','proportion_delivered','demands_fully_met','peak_current','total_energy_delivered','total_energy_requested','revenue','demand_charge','energy_cost','profit']
+
+def _add_profit(df, revenue):
+    """ Compute revenue, total_cost and profit for all rows at once. """
+    df['revenue'] = df['proportion_delivered'] / 100 * df['total_energy_requested'] * revenue
+    df['total_cost'] = df['demand_charge'] + df['energy_cost']
+    df['profit'] = df['revenue'] - df['total_cost']
+    return df
+
+def getDFResultStore(store, site, scenarios, time_month, algs):
+    """ getDFResult answered by a single query against a ResultsStore. """
+    months = {(str(day[0].date()), str(day[1].date())): month for month, day in time_month.items()}
+    df = store.query(site=site, tariff=tariff_name, revenue=revenue, scenario=list(scenarios), alg=list(algs),
+                     start=[start for start, _ in months])
+    df = df[[(start, end) in months for start, end in zip(df['start'], df['end'])]].copy()
+    df['month'] = [months[(start, end)] for start, end in zip(df['start'], df['end'])]
+    df['alg'] = df['alg'].replace({'ASA-PM-Hint': 'ASA-PM w/ Hint'})
+
+    _add_profit(df, revenue)
+    df.set_index('month',inplace=True)
+    return df[COL_SHOW]
+
+def iterMetrics(scenarios, time_month, algs, max_workers=16):
+    """ Yield one metrics row per run in grid order while a thread pool reads the files ahead. """
+    rows, configs = [], []
     for month,day in time_month.items():
-        startDate = day[0]
-        endDate = day[1]
-        for scenario in scenarios.keys():
-            for row, alg in enumerate(algs):    
-                config = {'scenario': scenario, 'start': startDate.date(), 'end': endDate.date(),
-                        'alg': alg, 'tariff': tariff_name, 'revenue': revenue}
-                metrics = get_metric(f'{RESULT_DIR_PROFIT}', config)
-                metrics['scenario'] = scenario
-                if alg == 'ASA-PM-Hint':
-                    alg = 'ASA-PM w/ Hint'
-                metrics['alg'] = alg
-                metrics['month'] = month
-                data.append(metrics)
-
-                df = pd.DataFrame(data)
-                df['revenue'] = df['proportion_delivered'] / 100 * df['total_energy_requested'] * revenue
-                df['total_cost'] = df['demand_charge'] + df['energy_cost']
-                df['profit'] = df['revenue'] - df['total_cost']
-                df.set_index('month',inplace=True)
-    return df[col_show]
-
-
-def getSimsResult(scenario_order, time_month, algs):
+        for scenario in scenarios:
+            for alg in algs:
+                rows.append({'scenario': scenario, 'alg': 'ASA-PM w/ Hint' if alg == 'ASA-PM-Hint' else alg, 'month': month})
+                configs.append({'scenario': scenario, 'start': day[0].date(), 'end': day[1].date(),
+                                'alg': alg, 'tariff': tariff_name, 'revenue': revenue})
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for row, metrics in zip(rows, pool.map(lambda config: get_metric(f'{RESULT_DIR_PROFIT}', config), configs)):
+            metrics.update(row)
+            yield metrics
+
+def getDFResult(scenarios, time_month, algs, store=None, site=None, max_workers=16):
+    if store is not None:
+        return getDFResultStore(store, site, scenarios, time_month, algs)
+    df = pd.DataFrame(list(iterMetrics(scenarios, time_month, algs, max_workers=max_workers)))
+    _add_profit(df, revenue)
+    df.set_index('month',inplace=True)
+    return df[COL_SHOW]
+
+def getDFProfit(df, revenues):
+    """ Re-evaluate revenue and profit of a getDFResult frame for several revenues ($/kWh) without re-reading any results. """
+    frames = []
+    for rate in revenues:
+        frame = _add_profit(df.copy(), rate)
+        frame['revenue_rate'] = rate
+        frames.append(frame)
+    return pd.concat(frames)
+
+
+def getSimsResult(scenario_order, time_month, algs, lazy=False):
     sims = dict()
     for month,day in time_month.items():
         startDate = day[0]
@@ -72,7 +110,10 @@ def getSimsResult(scenario_order, time_month, algs):
             for row, alg in enumerate(algs):    
                 config = {'scenario': scenario, 'start': startDate.date(), 'end': endDate.date(),
                         'alg': alg, 'tariff': tariff_name, 'revenue': revenue}
-                sim_get = get_sim(f'{RESULT_DIR_PROFIT}', config)
+                if lazy:
+                    sim_get = get_sim_result(f'{RESULT_DIR_PROFIT}', config)
+                else:
+                    sim_get = get_sim(f'{RESULT_DIR_PROFIT}', config)
                 sims[str(month)+ '_' + str(alg) + '_' + str(scenario)] = sim_get
     return sims
 
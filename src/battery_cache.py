@@ -0,0 +1,59 @@
+import os
+import json
+
+from acnportal.acnsim.models.battery import batt_cap_fn
+from utility import _atomic_open
+
+
+class BatteryCapacityCache:
+    """ Memoized replacement for `batt_cap_fn` with a persistent on-disk table.
+
+    Fits are keyed on the exact (delivered energy, stay duration, voltage, period), so every battery is
+    the one `batt_cap_fn` returns and event sets stay reproducible. Hits come from the same sessions
+    being built into several event sets (demand scenarios, overlapping intervals). Failed fits are
+    cached too and raise ValueError again, which keeps the caller's fallback to an ideal battery.
+    """
+    def __init__(self, path=None, capacity_fn=batt_cap_fn):
+        self.path           = path
+        self.capacity_fn    = capacity_fn
+
+        self.table          = {}
+        self.hits           = 0
+        self.misses         = 0
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.table = json.load(f)
+
+    def _key(self, requested_energy, stay_dur, voltage, period):
+        # repr round-trips floats exactly; tables of the earlier rounded keys never match these
+        return f'{float(requested_energy)!r}_{float(stay_dur)!r}_{voltage}_{period}'
+
+    def __call__(self, requested_energy, stay_dur, voltage, period):
+        key = self._key(requested_energy, stay_dur, voltage, period)
+        if key in self.table:
+            self.hits += 1
+        else:
+            self.misses += 1
+            try:
+                cap, init = self.capacity_fn(requested_energy, stay_dur, voltage, period)
+                self.table[key] = [float(cap), float(init)]
+            except Exception:
+                self.table[key] = None
+        if self.table[key] is None:
+            raise ValueError(f'No battery fit for {key}')
+        return tuple(self.table[key])
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        print(f'Battery capacity cache: {self.hits} hits, {self.misses} misses ({self.hit_rate:.1%} hit rate), {len(self.table)} entries')
+
+    def save(self):
+        """ Persist the table if any new fits were added. """
+        if self.path is None or self.misses == 0:
+            return
+        with _atomic_open(self.path) as f:
+            json.dump(self.table, f)
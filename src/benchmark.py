@@ -0,0 +1,236 @@
+""" Offline benchmark of the experiment pipeline on synthetic ACN-Data-like sessions.
+
+    python benchmark.py --network caltech --sessions 2000 --days 7 --out bench.json
+    python benchmark.py --network jpl --sessions 500 --compare bench.json
+"""
+import os
+import json
+import argparse
+import platform
+import tempfile
+from time import perf_counter
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from acnportal import acnsim
+from utility import _load_event_store
+from run_cache import _package_versions
+
+ALGORITHMS = ['Uncontrolled', 'EDF', 'LLF', 'RoundRobin']
+
+
+def synthetic_sessions(network='caltech', sessions=1000, days=7, stations=None, noise=0.2, start=datetime(2019, 10, 1), seed=0):
+    """ Sessions with the columns _pandas_toEvent expects, drawn from rough ACN-Data distributions.
+
+    Args:
+        network (str): 'jpl' or 'caltech', decides the station ids.
+        sessions (int): Number of sessions drawn. Sessions that find every station occupied are dropped.
+        days (int): Horizon length in days, arrivals are spread over all of them.
+        stations (int): Use only the first `stations` EVSEs of the network.
+        noise (float): Relative standard deviation of the user estimates (estimated departure and energy).
+        start (datetime): Naive local start of the horizon.
+        seed (int): Seed of the random generator.
+    """
+    rng         = np.random.default_rng(seed)
+    timezone    = pytz.timezone('America/Los_Angeles')
+    cn          = acnsim.sites.jpl_acn() if network == 'jpl' else acnsim.sites.caltech_acn()
+    station_ids = cn.station_ids[:stations] if stations else cn.station_ids
+
+    # workday arrivals around 8:30, stays around 7h, energy limited by what 6.6 kW can deliver
+    day         = rng.integers(0, days, sessions)
+    arrival_h   = np.clip(rng.normal(8.5, 2.0, sessions), 0, 20)
+    duration_h  = np.clip(rng.lognormal(np.log(7), 0.4, sessions), 0.5, 23.9 - arrival_h)
+    energy      = np.minimum(rng.gamma(2.0, 5.0, sessions), 6.6 * duration_h * 0.9)
+
+    # an EVSE holds one EV at a time: give each session a random free station, drop it if all are busy
+    arrival     = day * 24 + arrival_h
+    free_at     = np.full(len(station_ids), -np.inf)
+    station     = np.empty(sessions, dtype=object)
+    for i in np.argsort(arrival):
+        free = np.flatnonzero(free_at < arrival[i] - 0.25)
+        if len(free):
+            j = rng.choice(free)
+            station[i], free_at[j] = station_ids[j], arrival[i] + duration_h[i]
+    keep = station != None
+    day, arrival_h, duration_h, energy, station = day[keep], arrival_h[keep], duration_h[keep], energy[keep], station[keep]
+    sessions = int(keep.sum())
+
+    local_start     = pd.Timestamp(timezone.localize(start))
+    connection      = local_start + pd.to_timedelta(day * 24 + arrival_h, unit='h')
+    disconnect      = connection + pd.to_timedelta(duration_h, unit='h')
+    est_duration_h  = np.maximum(duration_h * (1 + rng.normal(0, noise, sessions)), 0.25)
+    est_energy      = np.maximum(energy * (1 + rng.normal(0, noise, sessions)), 0.1)
+
+    df = pd.DataFrame({
+        '_id'                       : [f'bench_{i}' for i in range(sessions)],
+        'userInputs'                : [[{'minutesAvailable': m, 'kWhRequested': e}] for m, e in zip(est_duration_h * 60, est_energy)],
+        'userID'                    : rng.integers(0, 500, sessions).astype(str),
+        'sessionID'                 : [f'bench_{i}' for i in range(sessions)],
+        'stationID'                 : station.astype(str),
+        'siteID'                    : network,
+        'clusterID'                 : network,
+        'connectionTime'            : connection,
+        'disconnectTime'            : disconnect,
+        'kWhDelivered'              : energy,
+        'doneChargingTime'          : disconnect,
+        'timezone'                  : 'America/Los_Angeles',
+        'estimated_departure'       : connection + pd.to_timedelta(est_duration_h, unit='h'),
+        'estimated_requested_energy': est_energy,
+    })
+    df['spaceID'] = df['stationID']
+    return df
+
+
+def _algorithm(name):
+    from acnportal import algorithms
+    if name == 'Uncontrolled':
+        return algorithms.UncontrolledCharging()
+    if name == 'EDF':
+        return algorithms.SortedSchedulingAlgo(algorithms.earliest_deadline_first)
+    if name == 'LLF':
+        return algorithms.SortedSchedulingAlgo(algorithms.least_laxity_first)
+    if name == 'RoundRobin':
+        return algorithms.RoundRobin(algorithms.first_come_first_served)
+    if name == 'Quick_charge':
+        import adacharge
+        return adacharge.AdaptiveSchedulingAlgorithm([
+            adacharge.ObjectiveComponent(adacharge.quick_charge),
+            adacharge.ObjectiveComponent(adacharge.equal_share, 1e-12)
+        ], solver='ECOS', max_recompute=1)
+    raise ValueError(f'Unknown algorithm {name}')
+
+
+class _Timer:
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def __call__(self, stage, alg=None):
+        start = perf_counter()
+        yield
+        elapsed = perf_counter() - start
+        if alg is None:
+            self.stages[stage] = elapsed
+        else:
+            self.stages.setdefault(stage, {})[alg] = elapsed
+
+
+def run_benchmark(network='caltech', sessions=1000, days=7, stations=None, noise=0.2, algs=ALGORITHMS,
+                  period=5, voltage=208, tariff_name='sce_tou_ev_4_march_2019', ideal_battery=False, seed=0):
+    """ Time every stage of the pipeline in a scratch directory and return a JSON-able report.
+
+    Jobs go through the same steps as in Experiment.run: run key, simulator, a run with the streaming metrics
+    collector attached, and storing with sharing. 'metrics_from_sim' times the analysis functions used when no
+    collector is available, 'summary' the getDFResult-like table of analytics.RunStack.
+    """
+    from experiment import Experiment
+    from streaming_metrics import MetricsCollector
+    from analytics import RunStack
+
+    params  = {'network': network, 'sessions': sessions, 'days': days, 'stations': stations, 'noise': noise,
+               'algs': list(algs), 'period': period, 'voltage': voltage, 'tariff': tariff_name,
+               'ideal_battery': ideal_battery, 'seed': seed}
+    timer   = _Timer()
+    start   = datetime(2019, 10, 1)
+    end     = start + timedelta(days=days)
+    df      = synthetic_sessions(network, sessions, days, stations, noise, start, seed)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            scenario = {'estimate_max_rate': False, 'uninterrupted_charging': False, 'quantized': False,
+                        'basic_evse': True, 'offline': False}
+            ex = Experiment(site=network, eventIntervals={'bench': [start, end]}, scenarios={'bench': scenario},
+                            periods=period, voltage=voltage)
+            with timer('event_creation'):
+                eventStore = _load_event_store(ex.timezone, ex.EVENTS_DIR, df, start, end, period, voltage,
+                                               ideal_battery=ideal_battery, demand_name='bench')
+            with timer('event_load'):
+                eventStore.to_event_queue()
+
+            # the per-job path of Experiment._run_job: run key, simulator, streaming metrics, storing and sharing
+            for job in ex._plan_jobs({algName: _algorithm(algName) for algName in algs}, tariff_name, 0.3):
+                algName = job['algName']
+                with timer('run_key', algName):
+                    ex._key_job(job, eventStore)
+                with timer('configure_sim', algName):
+                    sim = ex._configure_job(job, eventStore.to_event_queue())
+                collector = MetricsCollector()
+                collector.attach(sim)
+                with timer('run', algName):
+                    sim.run()
+                collector.detach(sim)
+                with timer('metrics', algName):
+                    collector.metrics(sim)
+                with timer('metrics_from_sim', algName):
+                    ex._calc_metrics(sim)
+                os.makedirs(job['path'], exist_ok=True)
+                # includes finalizing the collector's running totals again, which is what a real run pays
+                with timer('write', algName):
+                    ex._store_run(sim, job, collector=collector)
+
+            with timer('store_query'):
+                runs = ex.store.query(site=network, scenario='bench')
+            with timer('summary'):
+                # every run simulated the benchmark's own events, ideal battery or not
+                RunStack.from_runs(runs, network, voltage).summary(events_fn=lambda row: eventStore)
+        finally:
+            os.chdir(cwd)
+
+    return {
+        'created'   : datetime.now().isoformat(),
+        'python'    : platform.python_version(),
+        'packages'  : _package_versions(),
+        'params'    : params,
+        'stages'    : timer.stages,
+    }
+
+
+def _flatten(stages):
+    flat = {}
+    for stage, value in stages.items():
+        if isinstance(value, dict):
+            flat.update({f'{stage}/{alg}': seconds for alg, seconds in value.items()})
+        else:
+            flat[stage] = value
+    return flat
+
+
+def compare_reports(baseline, report):
+    """ Per-stage seconds of two reports and the ratio new / baseline. """
+    old, new = _flatten(baseline['stages']), _flatten(report['stages'])
+    rows = [{'stage': stage, 'baseline': old.get(stage), 'new': new.get(stage),
+             'ratio': new[stage] / old[stage] if stage in old and stage in new and old[stage] else None}
+            for stage in dict.fromkeys(list(old) + list(new))]
+    return pd.DataFrame(rows).set_index('stage')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--network', choices=['jpl', 'caltech'], default='caltech')
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--stations', type=int, default=None)
+    parser.add_argument('--noise', type=float, default=0.2)
+    parser.add_argument('--algs', nargs='+', default=ALGORITHMS)
+    parser.add_argument('--period', type=int, default=5)
+    parser.add_argument('--ideal-battery', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the JSON report here')
+    parser.add_argument('--compare', help='baseline JSON report to compare against')
+    args = parser.parse_args()
+
+    report = run_benchmark(args.network, args.sessions, args.days, args.stations, args.noise, args.algs,
+                           period=args.period, ideal_battery=args.ideal_battery, seed=args.seed)
+    print(json.dumps(report['stages'], indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare_reports(json.load(f), report).to_string())
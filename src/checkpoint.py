@@ -0,0 +1,70 @@
+import os
+import pickle
+
+from sim_hooks import hook, unhook
+from utility import _atomic_open
+
+CHECKPOINT_FILE = 'checkpoint.pkl'
+
+
+class Checkpointer:
+    """ Periodic snapshots of a running simulation, so that a killed run resumes where it stopped.
+
+    Every `every` iterations, at the top of the simulator loop, the checkpointer pickles itself to
+    <path>/checkpoint.pkl. That snapshot includes the simulator, which carries the time index, the EVs, the
+    charging history and the running peak seen by demand-charge objectives. It also includes the objects
+    hooked into the simulator (`state`, e.g. the metrics collector) and the run key. The checkpointer is
+    part of its own snapshot, so a resumed run keeps checkpointing.
+    """
+    def __init__(self, path, run_key, every=288):
+        self.path       = str(path)
+        self.run_key    = run_key
+        self.every      = every     # iterations between snapshots
+        self.state      = None
+        self._last      = 0
+
+    def attach(self, sim, **state):
+        self.state = dict(state, sim=sim)
+        hook(sim.event_queue, 'get_current_events').before.append(self._iteration)
+
+    def detach(self, sim):
+        # other listeners, e.g. SimProfiler's, stay hooked
+        method_hook = hook(sim.event_queue, 'get_current_events')
+        method_hook.before.remove(self._iteration)
+        if not method_hook.before and not method_hook.after:
+            unhook(sim.event_queue, 'get_current_events')
+
+    def _iteration(self, event_queue, args):
+        iteration = args[0]
+        if iteration - self._last >= self.every:
+            self._last = iteration
+            self.save()
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        with _atomic_open(os.path.join(self.path, CHECKPOINT_FILE), 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def resume(cls, path, run_key):
+        """ Checkpointer of the latest snapshot in `path`, or None if there is none for this run key. """
+        try:
+            with open(os.path.join(str(path), CHECKPOINT_FILE), 'rb') as f:
+                checkpointer = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f'Unreadable checkpoint - {path}')
+            print(e)
+            return None
+        if checkpointer.run_key != run_key:
+            print(f'Stale checkpoint - {path}')
+            return None
+        return checkpointer
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(os.path.join(str(path), CHECKPOINT_FILE))
+        except FileNotFoundError:
+            pass
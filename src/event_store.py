@@ -0,0 +1,198 @@
+import os
+import sys
+import glob
+import hashlib
+
+import numpy as np
+
+# One row per EV. Times are in simulation periods relative to the start of the event set.
+EVENT_DTYPE = np.dtype([
+    ('arrival',                     'i8'),
+    ('departure',                   'i8'),
+    ('requested_energy',            'f8'),
+    ('station_index',               'i4'),
+    ('session_id',                  'U64'),
+    ('battery_type',                'i1'),  # index into _battery_types()
+    ('capacity',                    'f8'),
+    ('init_charge',                 'f8'),
+    ('max_power',                   'f8'),
+    ('noise_level',                 'f8'),
+    ('transition_soc',              'f8'),
+    ('charge_stepwise',             '?'),
+    ('estimated_departure',         'i8'),
+    ('estimated_requested_energy',  'f8'),
+])
+
+EVENTS_EXT      = '.events.npy'
+STATIONS_EXT    = '.stations.npy'
+
+
+def _battery_types():
+    # acnportal loads scikit-learn, so it is only imported once EVs are built or converted
+    from acnportal.acnsim.models.battery import Battery, Linear2StageBattery
+    return [Battery, Linear2StageBattery]
+
+
+def _save_npy(path, array):
+    """ np.save through a temporary file so readers never map a partially written array. """
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def sample_days(n_days, days, seed):
+    """ Sorted random sample of `days` day indices out of an interval of n_days days, None for all of them. """
+    if days is None or days >= n_days:
+        return None
+    return sorted(np.random.default_rng(seed).choice(n_days, days, replace=False).tolist())
+
+
+class EventStore:
+    """ Columnar event set backed by a memory-mapped structured array.
+
+    Nothing is converted at load time; EVs and PluginEvents are only built when an
+    EventQueue is requested, and every request gets fresh objects.
+    """
+    def __init__(self, records, stations):
+        self.records    = records
+        self.stations   = stations
+        self._hash      = None
+
+    def __len__(self):
+        return len(self.records)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(path + EVENTS_EXT)
+
+    @classmethod
+    def load(cls, path):
+        """ Memory-map the store saved at `path` (without extension). """
+        records  = np.load(path + EVENTS_EXT, mmap_mode='r')
+        stations = np.load(path + STATIONS_EXT)
+        return cls(records, stations)
+
+    def save(self, path):
+        # stations first: the events file marks a complete store
+        _save_npy(path + STATIONS_EXT, np.asarray(self.stations))
+        _save_npy(path + EVENTS_EXT, np.asarray(self.records))
+
+    @classmethod
+    def from_evs(cls, evs):
+        stations    = sorted({ev.station_id for ev in evs})
+        index       = {station_id: i for i, station_id in enumerate(stations)}
+        records     = np.zeros(len(evs), dtype=EVENT_DTYPE)
+        battery_types = _battery_types()
+        for i, ev in enumerate(evs):
+            batt = ev._battery
+            records[i] = (
+                ev.arrival,
+                ev.departure,
+                ev.requested_energy,
+                index[ev.station_id],
+                ev.session_id,
+                battery_types.index(type(batt)),
+                batt._capacity,
+                batt._init_charge,
+                batt._max_power,
+                getattr(batt, '_noise_level', 0),
+                getattr(batt, '_transition_soc', 0.8),
+                getattr(batt, 'charge_calculation', 'continuous') == 'stepwise',
+                ev.estimated_departure,
+                getattr(ev, 'estimated_requested_energy', ev.requested_energy),
+            )
+        return cls(records, np.array(stations, dtype=str))
+
+    @classmethod
+    def from_event_queue(cls, eventQueue):
+        from acnportal.acnsim.events.event import PluginEvent
+        return cls.from_evs([event.ev for _, event in eventQueue.queue if isinstance(event, PluginEvent)])
+
+    def content_hash(self):
+        """ sha256 of the event data, used to detect changed event sets. """
+        if self._hash is None:
+            h = hashlib.sha256(np.ascontiguousarray(self.records).tobytes())
+            h.update(np.ascontiguousarray(self.stations).tobytes())
+            self._hash = h.hexdigest()
+        return self._hash
+
+    def resample(self, period, coarse_period, days=None):
+        """ Copy of the store on a coarser time grid, optionally restricted to some days.
+
+        Args:
+            period (int): Period of this store in minutes.
+            coarse_period (int): Period of the copy in minutes.
+            days (list[int]): Keep only EVs arriving on these days, counted from the start of the store.
+                Times are not shifted, so the ToU prices of every kept day stay the same.
+        """
+        records = np.array(self.records)
+        if days is not None:
+            records = records[np.isin(records['arrival'] // (24 * 60 // period), list(days))]
+        for field in ['arrival', 'departure', 'estimated_departure']:
+            records[field] = records[field] * period // coarse_period
+        records['departure'] = np.maximum(records['departure'], records['arrival'] + 1)
+        records['estimated_departure'] = np.maximum(records['estimated_departure'], records['arrival'] + 1)
+
+        # rounding can make sessions overlap: an EVSE holds one EV at a time, so end every session by the next arrival
+        records = records[np.lexsort((records['arrival'], records['station_index']))]
+        same_station = records['station_index'][1:] == records['station_index'][:-1]
+        records['departure'][:-1] = np.where(same_station, np.minimum(records['departure'][:-1], records['arrival'][1:]),
+                                             records['departure'][:-1])
+        records = records[records['departure'] > records['arrival']]
+        return EventStore(records[np.argsort(records['arrival'], kind='stable')], self.stations)
+
+    def window(self, period, first_day, days):
+        """ EVs arriving in [first_day, first_day + days), with times relative to the start of first_day. """
+        per_day = 24 * 60 // period
+        records = np.array(self.records)
+        arrival_day = records['arrival'] // per_day
+        records = records[(arrival_day >= first_day) & (arrival_day < first_day + days)]
+        for field in ['arrival', 'departure', 'estimated_departure']:
+            records[field] -= first_day * per_day
+        return EventStore(records, self.stations)
+
+    @staticmethod
+    def _battery(row, battery_types):
+        _, Linear2StageBattery = battery_types
+        batt_type = battery_types[row['battery_type']]
+        if batt_type is Linear2StageBattery:
+            return Linear2StageBattery(float(row['capacity']), float(row['init_charge']), float(row['max_power']),
+                                       noise_level=float(row['noise_level']), transition_soc=float(row['transition_soc']),
+                                       charge_calculation='stepwise' if row['charge_stepwise'] else 'continuous')
+        return batt_type(float(row['capacity']), float(row['init_charge']), float(row['max_power']))
+
+    def events(self):
+        """ Lazily yield a new PluginEvent for every row. """
+        from acnportal.acnsim.models.ev import EV
+        from acnportal.acnsim.events.event import PluginEvent
+        battery_types = _battery_types()
+        for row in self.records:
+            ev = EV(int(row['arrival']), int(row['departure']), float(row['requested_energy']),
+                    str(self.stations[row['station_index']]), str(row['session_id']), self._battery(row, battery_types),
+                    estimated_departure=int(row['estimated_departure']),
+                    estimated_requested_energy=float(row['estimated_requested_energy']))
+            yield PluginEvent(ev.arrival, ev)
+
+    def to_event_queue(self):
+        from acnportal.acnsim.events.event_queue import EventQueue
+        return EventQueue(list(self.events()))
+
+
+def migrate_json_cache(EVENTS_DIR):
+    """ Convert every EventQueue JSON cache in EVENTS_DIR that has no columnar store yet. """
+    from acnportal import acnsim
+    for json_path in sorted(glob.glob(os.path.join(str(EVENTS_DIR), '*.json'))):
+        path = json_path[:-len('.json')]
+        if EventStore.exists(path) or os.path.basename(path) == 'batt_cap_cache':
+            continue
+        with open(json_path, 'r') as f:
+            eventQueue = acnsim.EventQueue.from_json(f)
+        EventStore.from_event_queue(eventQueue).save(path)
+        print(f'Migrated - {json_path}')
+
+
+if __name__ == '__main__':
+    # python event_store.py Output/Events/jpl
+    for EVENTS_DIR in sys.argv[1:]:
+        migrate_json_cache(EVENTS_DIR)
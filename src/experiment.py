@@ -1,36 +1,57 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
-from copy import deepcopy
-from matplotlib import pyplot as plt
-import matplotlib.dates as mdates
-import matplotlib
+from copy import copy, deepcopy
 import numpy as np
-import pandas as pd
-import seaborn as sns
 import json
 import os
+import shutil
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from acnportal import acnsim, algorithms
-from acnportal.acnsim import analysis
-from acnportal.signals.tariffs import TimeOfUseTariff
-from utility import _pandas_toEvent, getEVENTS_DIR, getRESULT_DIR
-from adacharge import *
+# acnportal loads scikit-learn, so acnsim is only imported in the methods that build or analyse a simulation;
+# planning, skipping stored runs and unpickling in workers stay cheap
+from event_store import sample_days
+from utility import _atomic_open, _get_event_store, getEVENTS_DIR, getRESULT_DIR, getRESULTS_DB, getSCREENING_DB
+from results_store import ResultsStore
+from sim_reader import SIM_ARRAYS, SIM_FILES, compressed_text, sim_arrays, write_arrays, write_sim_arrays
+from result_writer import ResultWriter
+from run_cache import run_config, run_key, stored_run_key
+from profiling import SimProfiler
+from streaming_metrics import MetricsCollector
+from schedule_reuse import ScheduleReuse
+from job_queue import JobQueue
+from job_plan import done_marker, plan_jobs
+from checkpoint import Checkpointer
+import templates
 
 class Experiment:
     """ Wrapper for ACN-Sim Experiments including caching serialized experiment to disk. """
-    def __init__(self, site, eventIntervals, scenarios, periods=5, voltage=208):
+    def __init__(self, site, eventIntervals, scenarios, periods=5, voltage=208, profile=False, metrics_only=False, reuse_schedules=False,
+                 async_write=False, compression=None, checkpoint_every=None, chunk_days=None, chunk_workers=1):
         self.site           = site
         if site in ['jpl', 'caltech', 'office1']:
             self.timezone   = pytz.timezone('America/Los_Angeles')
             
         self.EVENTS_DIR     = getEVENTS_DIR(site)
         self.RESULTS_DIR    = getRESULT_DIR(site)
+        self.store          = ResultsStore(getRESULTS_DB())
         
         self.eventIntervals = eventIntervals
         self.scenarios      = scenarios
         
         self.periods        = periods
         self.voltage        = voltage
+        self.profile        = profile   # store per-call timings in profile.json for every run
+        self.metrics_only   = metrics_only  # keep only metrics, solve stats and run key, no sim.json or arrays
+        self.reuse_schedules = reuse_schedules  # skip solves whose optimal schedule is the previous one shifted, see ScheduleReuse
+        self.fidelity       = None          # {'period', 'days', 'seed'} of screening runs, see screen()
+        self.async_write    = async_write   # store results in a background thread while the next run simulates (workers=1 only)
+        self.compression    = compression   # None, 'gzip' or 'zstd' (needs zstandard) for sim.json
+        self.checkpoint_every = checkpoint_every  # iterations between checkpoints a killed run resumes from, None for none
+        self.chunk_days     = chunk_days    # simulate jobs as independent chunks of this many days, see _run_chunked()
+        self.chunk_workers  = chunk_workers # worker processes for the chunks of one job
+        self.index_results  = True          # add runs to the results store, off in job queue workers, see enqueue()
+        self._writer        = None
 
     def configure_sim(
         self,
@@ -44,8 +65,14 @@ class Experiment:
         allow_overcharging=False,
         tariff_name=None,
         offline=False,
+        end=None,
     ):
-        """ Configure simulation. """
+        """ Configure simulation.
+
+        The network and the tariff come from per-process templates, see templates.py. `end` sets the horizon
+        of the precomputed tariff prices, a month when not given.
+        """
+        from acnportal import acnsim, algorithms
         start_time = start
             
         if estimate_max_rate:
@@ -65,20 +92,17 @@ class Experiment:
                 alg.reallocate = True
             except:
                 pass
-        if self.site == "jpl":
-            cn = acnsim.sites.jpl_acn(voltage=self.voltage, basic_evse=basic_evse) 
-        elif self.site == "caltech":
-            cn = acnsim.sites.caltech_acn(voltage=self.voltage, basic_evse=basic_evse) 
-        else:
-            pass
-            
+        cn = templates.network(self.site, voltage=self.voltage, basic_evse=basic_evse)
+
         if tariff_name is not None:
-            signals = {'tariff': TimeOfUseTariff(tariff_name)}
+            # EVs may stay past the end of the interval, keep a couple of days of margin
+            days = (end - start).days + 2 if end is not None else 32
+            signals = {'tariff': templates.tariff(tariff_name, start, days, self._sim_period())}
         else:
             signals = {}
             
         sim = acnsim.Simulator(cn, alg, events, start_time, signals=signals,
-                            period=self.periods, verbose=False, store_schedule_history=False)
+                            period=self._sim_period(), verbose=False, store_schedule_history=False)
         
         if offline:
             alg.register_events(events)
@@ -86,79 +110,489 @@ class Experiment:
         
         return sim
 
-    def run(self, algs, tariff_name, revenue):
-        def _calc_metrics():
-            """ Calculate metrics from simulation. """
-            metrics = {
-                'proportion_delivered': analysis.proportion_of_energy_delivered(sim) * 100,
-                'demands_fully_met': analysis.proportion_of_demands_met(sim) * 100,
-                'peak_current': sim.peak,
-                'demand_charge': analysis.demand_charge(sim),
-                'energy_cost': analysis.energy_cost(sim),
-                'total_energy_delivered': analysis.total_energy_delivered(sim),
-                'total_energy_requested': analysis.total_energy_requested(sim)
-            }
-            return metrics
-
-        def _log_local_file(path):
-            """ Write simulation, metrics and solver statistics to disk. """
-            print("start Logging")
-            with open(path + f'/sim.json', 'w') as f:
-                sim.to_json(f)
-            with open(path + f'/metrics.json', 'w') as outfile:
-                json.dump(_calc_metrics(), outfile)
-            with open(path + f'/solve_stats.json', 'w') as outfile:
+    def __getstate__(self):
+        # the background writer belongs to the process running the sweep, e.g. chunk workers get none
+        state = self.__dict__.copy()
+        state['_writer'] = None
+        return state
+
+    def _sim_period(self):
+        """ Simulation period in minutes, coarser than the event period in screening runs. """
+        return self.fidelity['period'] if self.fidelity is not None else self.periods
+
+    def _calc_metrics(self, sim, collector=None):
+        """ Calculate metrics from simulation, from the running totals of `collector` when given. """
+        if collector is not None:
+            return collector.metrics(sim)
+        from acnportal.acnsim import analysis
+        metrics = {
+            'proportion_delivered': analysis.proportion_of_energy_delivered(sim) * 100,
+            'demands_fully_met': analysis.proportion_of_demands_met(sim) * 100,
+            'peak_current': sim.peak,
+            'demand_charge': analysis.demand_charge(sim),
+            'energy_cost': analysis.energy_cost(sim),
+            'total_energy_delivered': analysis.total_energy_delivered(sim),
+            'total_energy_requested': analysis.total_energy_requested(sim)
+        }
+        return metrics
+
+    def _done_marker(self, path):
+        """ Existing file that marks a complete run, see job_plan.done_marker(). """
+        return done_marker(path, metrics_only=bool(self.metrics_only or self.chunk_days))
+
+    def _log_local_file(self, sim, job, profiler=None, collector=None):
+        """ Write simulation, metrics, solver statistics and the simulation arrays to disk and index them in the results store.
+
+        Every file is written atomically and the done marker goes last, so its presence marks a complete run.
+        In metrics-only mode the simulation and its arrays are not written at all.
+        """
+        print("start Logging")
+        path    = job['path']
+        # files of an earlier run in this directory would otherwise outlive the ones this run does not write
+        _remove_run_files(path)
+        timed   = profiler.timed_write if profiler is not None else (lambda name: nullcontext())
+        with timed('metrics'):
+            metrics = self._calc_metrics(sim, collector)
+        with timed('solve_stats'):
+            with _atomic_open(path + f'/solve_stats.json') as outfile:
                 json.dump(sim.scheduler.solve_stats, outfile)
+        if self.index_results:
+            with timed('store'):
+                self.store.put(self._store_config(job), metrics, sim.scheduler.solve_stats, path)
+        if not self.metrics_only:
+            with timed('arrays'):
+                write_sim_arrays(sim, path, open_fn=_atomic_open)
+        with _atomic_open(path + f'/run_key.json') as outfile:
+            json.dump({'key': job['run_key'], 'config': job['run_config']}, outfile)
+        with _atomic_open(path + f'/metrics.json') as outfile:
+            json.dump(metrics, outfile)
+        if not self.metrics_only:
+            with timed('sim'):
+                sim_path = os.path.join(path, SIM_FILES[self.compression])
+                if self.compression is None:
+                    with _atomic_open(sim_path) as f:
+                        sim.to_json(f)
+                else:
+                    with _atomic_open(sim_path, 'wb') as raw, compressed_text(raw, self.compression) as f:
+                        sim.to_json(f)
+        if profiler is not None:
+            with _atomic_open(path + f'/profile.json') as outfile:
+                json.dump(profiler.to_dict(), outfile)
+        Checkpointer.remove(path)
 
-        def _run_and_store(path):
-            """ Run experiment and store results. """
-            # print(f'Starting - {path}')
-            if os.path.exists(path + f'/sim.json'):
-                print(f'Already Run - {path}...')
-                return
+    def _store_config(self, job):
+        """ Results store key of a job. """
+        return {'site': self.site, 'start': job['start'].date(), 'end': job['end'].date(), 'tariff': job['tariff_name'],
+                'revenue': job['revenue'], 'scenario': job['demand'], 'alg': job['algName']}
+
+    def _plan_jobs(self, algs, tariff_name, revenue):
+        """ Jobs of the sweep, see job_plan.plan_jobs(). """
+        return plan_jobs(self.RESULTS_DIR, self.eventIntervals, self.scenarios, algs, tariff_name, revenue)
+
+    def _job_events(self, job):
+        """ Event store of a job, resampled for screening runs. """
+        eventStore = _get_event_store(self.site, self.timezone, self.EVENTS_DIR, job['start'], job['end'], self.periods, self.voltage, ideal_battery = False, max_len=None, force_feasible=False, demand_name=str(job['demand']))
+        if self.fidelity is not None:
+            days = sample_days((job['end'] - job['start']).days, self.fidelity['days'], self.fidelity['seed'])
+            eventStore = eventStore.resample(self.periods, self.fidelity['period'], days)
+        return eventStore
+
+    def _key_job(self, job, eventStore):
+        """ Set the run configuration and run key of a job. """
+        options = {'reuse_schedules': True} if self.reuse_schedules else {}
+        if self.chunk_days:
+            options['chunk_days'] = self.chunk_days
+        if self.fidelity is not None:
+            # lets analyses rebuild the resampled events of a screening run
+            options['fidelity'] = dict(self.fidelity, events_period=self.periods)
+        job['run_config'] = run_config(job['alg'], job['scenario'], eventStore.content_hash(), self._sim_period(), self.voltage, job['tariff_name'],
+                                       job['start'], job['end'], options)
+        job['run_key']    = run_key(job['run_config'])
+
+    def _dedupe_jobs(self, jobs):
+        """ Simulate every distinct run configuration once.
+
+        Jobs with the same run key, e.g. the same algorithm under different revenues that never reach its
+        objective, are attached to the first of them as its 'copies'. That job fills in their result entries
+        from its own stored run, see _share_run(). Metrics do not depend on the revenue (profit is derived
+        from them at analysis time), so nothing needs to be recomputed.
+
+        Returns:
+            list: The jobs to run.
+        """
+        primaries = {}
+        for job in jobs:
             try:
-                sim.run()
-                if not os.path.exists(path):
-                    os.makedirs(path)
-                _log_local_file(path)
+                self._key_job(job, self._job_events(job))
+            except Exception:
+                # fails again, and is reported, when the job runs
+                primaries[id(job)] = job
+                continue
+            primary = primaries.setdefault(job['run_key'], job)
+            if primary is not job:
+                primary.setdefault('copies', []).append(job)
+        return list(primaries.values())
+
+    def _share_run(self, job):
+        """ Fill the result directories and store rows of the job's copies from its stored run.
+
+        Large files are hard-linked where the filesystem allows it, the done marker is linked last.
+        """
+        source  = job['path']
+        marker  = os.path.basename(self._done_marker(source))
+        metrics = _read_json(os.path.join(source, 'metrics.json'))
+        solve_stats = _read_json(os.path.join(source, 'solve_stats.json'))
+        for twin in job.get('copies', []):
+            path = twin['path']
+            if self._done_marker(path) is not None and stored_run_key(path) == job['run_key']:
+                continue
+            os.makedirs(path, exist_ok=True)
+            _remove_run_files(path)
+            names = [name for name in os.listdir(source) if name not in [marker, 'run_key.json', 'profile.json'] and not name.startswith('.')]
+            for name in names + [marker]:
+                if name == marker:
+                    if self.index_results:
+                        self.store.put(self._store_config(twin), metrics, solve_stats, path)
+                    with _atomic_open(os.path.join(path, 'run_key.json')) as outfile:
+                        json.dump({'key': job['run_key'], 'config': job['run_config'], 'shared_from': source}, outfile)
+                _link_or_copy(os.path.join(source, name), os.path.join(path, name))
+            print(f'Shared - {path}')
+
+    def _store_run(self, sim, job, profiler=None, collector=None):
+        """ Store a finished run and share it with the job's copies. """
+        self._log_local_file(sim, job, profiler, collector)
+        self._share_run(job)
+
+    def _configure_job(self, job, events, start=None):
+        """ Simulator of a job, starting at `start` instead of the job start for day chunks. """
+        scenario = job['scenario']
+        return self.configure_sim(
+            alg                 = deepcopy(job['alg']),
+            start               = start or job['start'],
+            events              = events,
+            basic_evse          = scenario['basic_evse'],
+            estimate_max_rate   = scenario['estimate_max_rate'],
+            uninterrupted_charging  = scenario['uninterrupted_charging'],
+            quantized           = scenario['quantized'],
+            tariff_name         = job['tariff_name'],
+            offline             = scenario['offline'],
+            end                 = job['end']
+        )
+
+    def _run_chunked(self, job, eventStore):
+        """ Simulate the job as independent chunks of chunk_days days, chunk_workers at a time, and stitch them.
+
+        Every chunk gets the EVs arriving on its days and runs until they have all left. The running peak is
+        carried forward through sim.peak, which demand-charge objectives read via interface.get_prev_peak(). With
+        one worker the chunks run in order and always start from the carried-forward peak. In parallel they all
+        start from zero, and afterwards every chunk that stayed below the peak of its predecessors is re-run in
+        order from that peak; chunks that exceeded it on their own are kept. Objectives that use the time index (e.g.
+        days_remaining_scale_demand_charge) see time relative to the chunk start.
+
+        Returns:
+            (dict, list, dict): Metrics, solve stats and SIM_ARRAYS of the whole horizon.
+        """
+        period      = self._sim_period()
+        n_days      = (job['end'] - job['start']).days
+        first_days  = list(range(0, n_days, self.chunk_days))
+        stores      = [eventStore.window(period, day, self.chunk_days) for day in first_days]
+        starts      = [job['start'] + timedelta(days=day) for day in first_days]
+
+        results, peaks = [None] * len(first_days), [0.0] * len(first_days)
+        if self.chunk_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.chunk_workers) as pool:
+                futures = [pool.submit(_run_chunk, self, job, store, start, 0.0) for store, start in zip(stores, starts)]
+                results = [future.result() for future in futures]
+        for k, (store, start) in enumerate(zip(stores, starts)):
+            carried = max(peaks[:k], default=0.0)
+            if results[k] is None or results[k]['peak'] < carried:
+                if results[k] is not None:
+                    print(f'Re-running chunk {start.date()} with the carried-forward peak {carried:.1f} A')
+                results[k] = _run_chunk(self, job, store, start, carried)
+            peaks[k] = results[k]['peak']
+
+        per_day     = 24 * 60 // period
+        length      = max(day * per_day + r['arrays']['charging_rates'].shape[1] for day, r in zip(first_days, results))
+        arrays      = {'station_ids': results[0]['arrays']['station_ids']}
+        for name in ['charging_rates', 'pilot_signals']:
+            stitched = np.zeros((len(arrays['station_ids']), length))
+            for day, result in zip(first_days, results):
+                chunk = result['arrays'][name]
+                stitched[:, day * per_day: day * per_day + chunk.shape[1]] += chunk
+            arrays[name] = stitched
+        arrays['aggregate_current'] = arrays['charging_rates'].sum(axis=0)
+
+        parts       = [result['metrics'] for result in results]
+        requested   = sum(m['total_energy_requested'] for m in parts)
+        delivered   = sum(m['total_energy_delivered'] for m in parts)
+        evs         = sum(result['evs'] for result in results)
+        # sessions running past midnight overlap the next chunk, so the peaks come from the stitched arrays
+        peak_power  = float((results[0]['voltages'] @ arrays['charging_rates']).max(initial=0.0)) / 1000
+        metrics = {
+            'proportion_delivered': delivered / requested * 100,
+            'demands_fully_met': sum(m['demands_fully_met'] * r['evs'] for m, r in zip(parts, results)) / evs,
+            'peak_current': float(arrays['aggregate_current'].max(initial=0.0)),
+            'demand_charge': templates.tariff(job['tariff_name'], job['start'], 1, period).get_demand_charge(job['start']) * peak_power,
+            'energy_cost': sum(m['energy_cost'] for m in parts),
+            'total_energy_delivered': delivered,
+            'total_energy_requested': requested
+        }
+        solve_stats = [stats for result in results for stats in result['solve_stats']]
+        return metrics, solve_stats, arrays
+
+    def _log_chunked(self, job, metrics, solve_stats, arrays):
+        """ _log_local_file for stitched day chunks: there is no single simulator, metrics.json marks completion. """
+        path = job['path']
+        # no sim.json is written, one of an earlier unchunked run must not survive next to the stitched arrays
+        _remove_run_files(path)
+        with _atomic_open(path + f'/solve_stats.json') as outfile:
+            json.dump(solve_stats, outfile)
+        if self.index_results:
+            self.store.put(self._store_config(job), metrics, solve_stats, path)
+        if not self.metrics_only:
+            write_arrays(arrays, path, open_fn=_atomic_open)
+        with _atomic_open(path + f'/run_key.json') as outfile:
+            json.dump({'key': job['run_key'], 'config': job['run_config']}, outfile)
+        with _atomic_open(path + f'/metrics.json') as outfile:
+            json.dump(metrics, outfile)
+
+    def _run_job(self, job):
+        """ Run a single job and store its results.
+
+        Returns:
+            str: 'skipped', 'done' or 'failed'.
+        """
+        path = job['path']
+        try:
+            eventStore = self._job_events(job)
+            self._key_job(job, eventStore)
+            marker = self._done_marker(path)
+            if marker is not None:
+                if stored_run_key(path) == job['run_key']:
+                    print(f'Already Run - {path}...')
+                    self._share_run(job)
+                    return 'skipped'
+                # configuration changed since the stored run, none of its files may outlive the re-run
+                print(f'Stale - {path}...')
+                _remove_run_files(path)
+
+            if self.chunk_days:
+                metrics, solve_stats, arrays = self._run_chunked(job, eventStore)
+                os.makedirs(path, exist_ok=True)
+                self._log_chunked(job, metrics, solve_stats, arrays)
+                self._share_run(job)
                 print(f'Done - {path}')
-            except Exception as e:
-                print(f'Failed - {path}')
-                print(e)
-        
+                return 'done'
+
+            checkpointer = Checkpointer.resume(path, job['run_key']) if self.checkpoint_every else None
+            if checkpointer is not None:
+                # the snapshot holds the simulator together with everything hooked into it
+                sim, collector, profiler, reuse = (checkpointer.state[k] for k in ['sim', 'collector', 'profiler', 'reuse'])
+                print(f'Resume - {path} at iteration {sim.iteration}')
+            else:
+                sim = self._configure_job(job, eventStore.to_event_queue())
+                reuse = ScheduleReuse.install(sim.scheduler) if self.reuse_schedules else None
+                collector = MetricsCollector()
+                collector.attach(sim)
+                profiler = SimProfiler() if self.profile else None
+                if profiler is not None:
+                    profiler.attach(sim)
+                if self.checkpoint_every:
+                    checkpointer = Checkpointer(path, job['run_key'], self.checkpoint_every)
+                    checkpointer.attach(sim, collector=collector, profiler=profiler, reuse=reuse)
+            if profiler is not None:
+                with profiler.record_cvxpy():
+                    sim.run()
+            else:
+                sim.run()
+            if checkpointer is not None:
+                checkpointer.detach(sim)
+            if profiler is not None:
+                profiler.detach(sim)
+            collector.detach(sim)
+            if reuse is not None:
+                ScheduleReuse.uninstall(sim.scheduler)
+                print(f'Schedules - {reuse.stats()}')
+            os.makedirs(path, exist_ok=True)
+            if self._writer is not None:
+                # failed writes are counted by run() once the writer is closed
+                self._writer.submit(path, self._store_run, sim, job, profiler, collector)
+            else:
+                self._store_run(sim, job, profiler, collector)
+            print(f'Done - {path}')
+            return 'done'
+        except Exception as e:
+            print(f'Failed - {path}')
+            print(e)
+            return 'failed'
+
+    def run(self, algs, tariff_name, revenue, workers=1):
+        """ Run every (month, demand scenario, algorithm) combination.
+
+        Args:
+            algs (dict): Algorithm name -> scheduling algorithm.
+            tariff_name (str): Name of the TimeOfUseTariff used for costs.
+            revenue (float or list): Revenue per kWh, only used to label the results unless an objective uses it.
+                Runs that are identical for several revenues are simulated once, see _dedupe_jobs().
+            workers (int): Number of worker processes. With 1 the jobs run in this process, and with async_write
+                each run is stored by a background thread while the next one simulates.
+
+        Returns:
+            dict: Number of jobs per status ('skipped', 'done', 'failed').
+        """
+        planned = self._plan_jobs(algs, tariff_name, revenue)
+        jobs    = self._dedupe_jobs(planned)
+        status  = {'skipped': 0, 'done': 0, 'failed': 0}
+
         simStartTime = datetime.now()
-        print(f"--------------------- Start simulation at {simStartTime} ---------------------")
-        for month, date in self.eventIntervals.items():
-            print(f'{month: <9}: {date[0]} -- {date[1]}')
-            start, end  = date[0], date[1]
-            
-            for demand, scenario in scenarios.items():                
-                for algName, alg in algs.items(): 
-                    
-                    outputFile_path = self.RESULTS_DIR.joinpath(algName, f"{start.date()} {end.date()}",tariff_name, str(revenue), demand)
-                    outputFile_path.mkdir(parents=True, exist_ok=True)
-                    outputFile_path = str(outputFile_path)
-                    
-                    eventName = str(demand)
-                    events    = _pandas_toEvent(self.timezone, self.EVENTS_DIR, "_", start, end, self.periods, self.voltage, ideal_battery = False, max_len=None, force_feasible=False, demand_name=eventName)
-
-                    sim = self.configure_sim(
-                        alg                 = deepcopy(alg),
-                        start               = start,
-                        events              = events,
-                        basic_evse          = scenario['basic_evse'],
-                        estimate_max_rate   = scenario['estimate_max_rate'],
-                        uninterrupted_charging  = scenario['uninterrupted_charging'],
-                        quantized           = scenario['quantized'],
-                        tariff_name         = tariff_name,
-                        offline             = scenario['offline']   
-                    )
-                    _run_and_store(outputFile_path)
-                    simEndTime = datetime.now()
-                    print(f"---------------------End simulation at {simEndTime} ---------------------")
-                
+        print(f"--------------------- Start simulation at {simStartTime} ({len(jobs)} jobs, {len(planned) - len(jobs)} shared, {workers} workers) ---------------------")
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(self._run_job, job): job for job in jobs}
+                for finished, future in enumerate(as_completed(futures), 1):
+                    try:
+                        status[future.result()] += 1
+                    except Exception as e:
+                        # the worker process itself died, e.g. killed by the OOM killer
+                        print(f'Failed - {futures[future]["path"]}')
+                        print(e)
+                        status['failed'] += 1
+                    _print_progress(finished, len(jobs), simStartTime)
+        else:
+            self._writer = ResultWriter() if self.async_write else None
+            try:
+                for finished, job in enumerate(jobs, 1):
+                    status[self._run_job(job)] += 1
+                    _print_progress(finished, len(jobs), simStartTime)
+            finally:
+                if self._writer is not None:
+                    failures, self._writer = self._writer.close(), None
+                    status['done'] -= len(failures)
+                    status['failed'] += len(failures)
+
+        simEndTime = datetime.now()
+        print(f"---------------------End simulation at {simEndTime} {status} ---------------------")
+        return status
+
+    def screen(self, algs, tariff_name, revenue, period=15, days=5, metric='profit', top_k=3, seed=0, workers=1):
+        """ Multi-fidelity sweep: screen every algorithm cheaply, then run only the best ones at full resolution.
+
+        Every (revenue, month, demand scenario, algorithm) job first runs with a `period` minute simulation period
+        over `days` randomly sampled days of its interval. For every revenue, algorithms are ranked by the mean of
+        `metric` over all months and scenarios and the `top_k` best are run at full resolution with run().
+
+        Screening runs are written to <RESULTS_DIR>/Screening in metrics-only mode and indexed in their own results
+        store (Output/Results/screening.sqlite), with the ranking in <RESULTS_DIR>/Screening/screening.json.
+        Full-resolution runs go to the usual results directory and store.
+
+        Args:
+            algs, tariff_name, revenue: As for run().
+            metric (str): 'profit' or any metric column, e.g. 'proportion_delivered' or 'peak_current'.
+                Costs and peaks are minimized, everything else maximized.
+
+        Returns:
+            (pd.DataFrame, dict): Screening ranking, best first per revenue, and the status of the full-resolution runs.
+        """
+        revenues                = revenue if isinstance(revenue, (list, tuple)) else [revenue]
+        names                   = list(algs(revenues[0]) if callable(algs) else algs)
+        screening               = copy(self)
+        screening.fidelity      = {'period': period, 'days': days, 'seed': seed}
+        screening.RESULTS_DIR   = self.RESULTS_DIR.joinpath('Screening')
+        screening.store         = ResultsStore(getSCREENING_DB())
+        screening.metrics_only  = True
+        screening.RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        print(f'Screening {len(names)} algorithms at {period} min over {days} days per interval')
+        screening.run(algs, tariff_name, revenue, workers=workers)
+
+        df = screening.store.query(site=self.site, tariff=tariff_name, revenue=revenues, scenario=list(self.scenarios),
+                                   alg=names, start=[str(date[0].date()) for date in self.eventIntervals.values()])
+        # every row is priced at its own revenue
+        df['profit'] = (df['proportion_delivered'] / 100 * df['total_energy_requested'] * df['revenue'].astype(float)
+                        - df['demand_charge'] - df['energy_cost'])
+        ranking = df.groupby(['revenue', 'alg'])[metric].mean().reset_index()
+        ranking = ranking.sort_values(['revenue', metric], ascending=[True, metric in _MINIMIZED], ignore_index=True)
+        ranking['promoted'] = ranking.groupby('revenue').cumcount() < top_k
+        ranking = ranking.assign(period=period, days=days, seed=seed)
+        with _atomic_open(str(screening.RESULTS_DIR.joinpath('screening.json'))) as f:
+            json.dump({'metric': metric, 'tariff': tariff_name, 'revenue': revenue,
+                       'ranking': ranking.to_dict(orient='records')}, f, indent=2)
+        print(ranking.to_string())
+
+        promoted = ranking[ranking['promoted']].groupby('revenue')['alg'].apply(set).to_dict()
+        def promoted_algs(rev):
+            return {algName: alg for algName, alg in (algs(rev) if callable(algs) else algs).items()
+                    if algName in promoted.get(str(rev), set())}
+        return ranking, self.run(promoted_algs, tariff_name, revenue, workers=workers)
+
+    def enqueue(self, queue_dir, algs, tariff_name, revenue):
+        """ Write the sweep as a shared-filesystem job queue instead of running it.
+
+        Start any number of `python job_queue.py worker <queue_dir>` processes, on any machine that sees the
+        same filesystem, to run it; `python job_queue.py status <queue_dir>` reports progress. Workers only write
+        the result directories, `python job_queue.py index <queue_dir>` adds the finished runs to the results store.
+        """
+        jobs = self._dedupe_jobs(self._plan_jobs(algs, tariff_name, revenue))
+        worker = copy(self)
+        worker.index_results = False
+        return JobQueue.create(queue_dir, worker, jobs)
+
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _remove_run_files(path):
+    """ Remove the stored run in `path`, done markers first so that a partial removal never looks complete.
+    Checkpoints are kept, Checkpointer.resume() checks their run key itself. """
+    names = list(SIM_FILES.values()) + ['metrics.json'] + [name + '.npy' for name in SIM_ARRAYS] \
+            + ['solve_stats.json', 'profile.json', 'run_key.json']
+    for name in names:
+        if os.path.exists(os.path.join(path, name)):
+            os.remove(os.path.join(path, name))
+
+
+def _link_or_copy(source, target):
+    """ Atomically place a hard link to `source` at `target`, or a copy where hard links are not supported. """
+    tmp_path = f'{target}.{os.getpid()}.tmp'
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, target)
+
+
+def _run_chunk(experiment, job, eventStore, start, peak):
+    """ Simulate one day chunk of a job, starting from the carried-forward peak (A). """
+    sim = experiment._configure_job(job, eventStore.to_event_queue(), start)
+    sim.peak = peak
+    collector = MetricsCollector()
+    collector.attach(sim)
+    sim.run()
+    collector.detach(sim)
+    return {'metrics': collector.metrics(sim) if sim.ev_history else _EMPTY_METRICS, 'evs': len(sim.ev_history),
+            'voltages': np.asarray(sim.network._voltages, dtype=float), 'peak': sim.peak,
+            'solve_stats': sim.scheduler.solve_stats, 'arrays': sim_arrays(sim)}
+
+
+_EMPTY_METRICS = {'proportion_delivered': 0.0, 'demands_fully_met': 0.0, 'peak_current': 0.0, 'demand_charge': 0.0,
+                  'energy_cost': 0.0, 'total_energy_delivered': 0.0, 'total_energy_requested': 0.0}
+
+# screening metrics that are better when lower
+_MINIMIZED = {'peak_current', 'demand_charge', 'energy_cost'}
+
+
+def _print_progress(finished, total, startTime):
+    """ Print sweep progress with an ETA extrapolated from the average job duration so far. """
+    elapsed = datetime.now() - startTime
+    eta     = elapsed / finished * (total - finished)
+    print(f'[{finished}/{total}] elapsed {str(elapsed).split(".")[0]} - ETA {str(eta).split(".")[0]}')
+
 if __name__ == "__main__":
-    
+    # solver stack, only needed by the algorithms below; sweeps driven by a config file use sweep.py
+    import adacharge
+    from adacharge import *
+
     # event interval to simulate
     time_month = {
         'October' :[(datetime(2019,  10, 1)),(datetime(2019, 10, 2))],
@@ -185,7 +619,7 @@ if __name__ == "__main__":
     }
     
     tariff_name = 'sce_tou_ev_4_march_2019'
-    revenue     = 0.3
+    revenue     = 0.3 # or a list, runs that do not depend on it are simulated once
     site        = 'jpl'
     
     peakCurrent      = 500 #Ampere
@@ -218,5 +652,24 @@ if __name__ == "__main__":
     
     ALGS['Quick_charge'] =  AdaptiveSchedulingAlgorithm(Quick_charge, solver='ECOS', max_recompute=1)
      
-    ex = Experiment(site=site, eventIntervals=time_month, scenarios=scenarios)
-    ex.run(algs=ALGS, tariff_name=tariff_name, revenue=revenue)
\ No newline at end of file
+    workers     = 1 # number of parallel worker processes
+    profile     = False # write per-call timings to profile.json, summarize with `python profiling.py Output/Results/<site>`
+    metricsOnly = False # only keep metrics.json, skip writing sim.json and the simulation arrays
+    reuseSchedules = False # reuse the previous optimal schedule while sessions charge exactly as planned
+    asyncWrite  = False # store each run in a background thread while the next one simulates (workers = 1)
+    compression = None # None, 'gzip' or 'zstd': compress sim.json
+    checkpointEvery = None # e.g. 288: checkpoint every day of 5 min periods, a re-run resumes from the last one
+    chunkDays   = None # e.g. 1: simulate every job as independent day chunks and stitch them together
+    chunkWorkers = 1 # worker processes for the chunks of one job
+    screenTopK  = None # e.g. 3: screen all ALGS at 15 min over 5 sampled days first, run only the 3 best by profit
+    queueDir    = None # e.g. 'Output/Queue/sweep1': only write a job queue for `python job_queue.py worker`
+
+    ex = Experiment(site=site, eventIntervals=time_month, scenarios=scenarios, profile=profile, metrics_only=metricsOnly, reuse_schedules=reuseSchedules,
+                    async_write=asyncWrite, compression=compression, checkpoint_every=checkpointEvery,
+                    chunk_days=chunkDays, chunk_workers=chunkWorkers)
+    if queueDir is not None:
+        ex.enqueue(queueDir, algs=ALGS, tariff_name=tariff_name, revenue=revenue)
+    elif screenTopK is not None:
+        ex.screen(algs=ALGS, tariff_name=tariff_name, revenue=revenue, top_k=screenTopK, workers=workers)
+    else:
+        ex.run(algs=ALGS, tariff_name=tariff_name, revenue=revenue, workers=workers)
\ No newline at end of file
@@ -13,10 +13,11 @@ from acnportal.acnsim.events.acndata_events import _datetime_to_timestamp
 from acnportal.acnsim.models.battery import Battery
 from acnportal.acnsim.events.event import PluginEvent
 from acnportal.acnsim.events.event_queue import EventQueue
-from utility import _pandas_toEvent, getEVENTS_DIR
+from utility import _pandas_toEvent, getEVENTS_DIR, getSESSIONS_DIR
+from session_store import SessionStore
 
 class EventCreator:
-    def __init__(self, site, eventIntervals, API_KEY, periods=5, voltage=208):       
+    def __init__(self, site, eventIntervals, API_KEY, periods=5, voltage=208, client=None):       
         self.site           = site
         self.EVENTS_DIR     = getEVENTS_DIR(site)
     
@@ -25,6 +26,9 @@ class EventCreator:
         
         self.periods        = periods
         self.voltage        = voltage
+
+        # raw sessions are kept locally, the DataClient is only created when a day is missing
+        self.sessionStore   = SessionStore(getSESSIONS_DIR(), client=client, client_fn=lambda: DataClient(self.API_KEY))
     
     def createEvent(self): 
         if self.site in ['jpl', 'caltech', 'office1']:
@@ -36,10 +40,7 @@ class EventCreator:
     def _createDF_ACN(self):
         def getDataACN():
             # only appicible for ACN sites, ["jpl", "caltech", "office1"]
-            client      = DataClient(self.API_KEY)
-            docs        = client.get_sessions_by_time(self.site, timezone.localize(start), timezone.localize(end))
-            df          = pd.DataFrame.from_dict(docs)
-            return df
+            return self.sessionStore.get_sessions(self.site, start, end)
         
         def prepTrueValueDF(DF: pd.DataFrame):
             df = DF.copy()
@@ -89,6 +90,7 @@ class EventCreator:
         timezone    = pytz.timezone('America/Los_Angeles')    
         dfACN = {"TrueValue":{}, "userInputs":{}}
         print("Downloading from ACN website")
+        self.sessionStore.fetch(self.site, list(self.eventIntervals.values()))
         for month, date in self.eventIntervals.items():
             print(f'{month: <9}: {date[0]} -- {date[1]}')
             start, end  = date[0], date[1]
@@ -98,7 +100,7 @@ class EventCreator:
 
         print("Saving events")
         for demand in dfACN.keys():
-            for month, date in time_month.items():
+            for month, date in self.eventIntervals.items():
                 print(f'{month: <9} : {demand: <12} ')
                 name = str(demand) 
                 _pandas_toEvent(timezone, self.EVENTS_DIR, dfACN[demand][month], date[0], date[1], self.periods, self.voltage, ideal_battery = False, max_len=None, force_feasible=False, demand_name= name)
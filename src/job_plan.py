@@ -0,0 +1,47 @@
+""" Expansion of a sweep into jobs and the completion markers of their runs.
+
+Kept free of acnportal and pandas so that planning a sweep, e.g. `python sweep.py --dry-run`, imports neither.
+"""
+import os
+
+from sim_reader import find_sim_json
+
+
+def plan_jobs(results_dir, eventIntervals, scenarios, algs, tariff_name, revenue):
+    """ Expand the (revenue, month, demand scenario, algorithm) grid into a list of independent jobs.
+
+    `revenue` is a value or a list of values, `algs` a dict or a function of the revenue returning one,
+    for objectives that use the revenue.
+    """
+    jobs = []
+    for rev in (revenue if isinstance(revenue, (list, tuple)) else [revenue]):
+        for month, date in eventIntervals.items():
+            start, end  = date[0], date[1]
+            for demand, scenario in scenarios.items():
+                for algName, alg in (algs(rev) if callable(algs) else algs).items():
+                    outputFile_path = results_dir.joinpath(algName, f"{start.date()} {end.date()}", tariff_name, str(rev), demand)
+                    jobs.append({
+                        'month'         : month,
+                        'start'         : start,
+                        'end'           : end,
+                        'demand'        : demand,
+                        'scenario'      : scenario,
+                        'algName'       : algName,
+                        'alg'           : alg,
+                        'tariff_name'   : tariff_name,
+                        'revenue'       : rev,
+                        'path'          : str(outputFile_path),
+                    })
+    return jobs
+
+
+def done_marker(path, metrics_only=False):
+    """ Existing file that marks a complete run: sim.json in any compression, or metrics.json for runs stored
+    without a simulator (metrics-only mode and day chunks).
+
+    Returns:
+        str: Path of the marker, None if the run is not complete.
+    """
+    if metrics_only:
+        return path + '/metrics.json' if os.path.exists(path + '/metrics.json') else None
+    return find_sim_json(path)
@@ -0,0 +1,271 @@
+""" Shared-filesystem job queue for distributed sweeps.
+
+    python job_queue.py worker Output/Queue/sweep1 [--lease 900]
+    python job_queue.py status Output/Queue/sweep1
+    python job_queue.py retry-failed Output/Queue/sweep1
+    python job_queue.py index Output/Queue/sweep1
+
+The queue directory holds
+    manifest.json       job records in sweep order
+    jobs/<id>.pkl       pickled (experiment, job) payload, see Experiment.enqueue()
+    leases/<id>.<n>.json    n-th claim of a running job, renewed by its worker until done
+    done/<id>.json      finished jobs (done or skipped) with their run key
+    failed/<id>.json    failed jobs with the error
+
+Job ids are derived from the result path, so re-creating a queue after the sweep changed keeps the markers of
+unchanged jobs only; markers of jobs whose run key changed are dropped. Workers only write the per-run files,
+because SQLite cannot be written safely from several hosts on a network filesystem. Run `index` once the queue is
+finished to add the runs to the results store. A lease is created by hard-linking a complete file to a fresh name,
+which fails if the name exists, so exactly one worker wins a job. A worker renews its lease while the job runs; a lease
+that is not renewed expires and is taken over with a claim of the next number, so a takeover never replaces a newer
+lease and the old holder notices it lost the job at its next renewal. Algorithms are pickled, so their objective
+functions must be importable from a module rather than defined in __main__.
+"""
+import os
+import json
+import time
+import hashlib
+import socket
+import pickle
+import argparse
+import threading
+import traceback
+
+MANIFEST = 'manifest.json'
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _write_pickle(path, data):
+    tmp_path = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class JobQueue:
+    def __init__(self, root):
+        self.root = str(root)
+
+    def _path(self, kind, job_id, ext='.json'):
+        return os.path.join(self.root, kind, job_id + ext)
+
+    @staticmethod
+    def job_id(job):
+        return hashlib.sha256(job['path'].encode()).hexdigest()[:16]
+
+    @classmethod
+    def create(cls, root, experiment, jobs):
+        """ Write a manifest and one payload per job.
+
+        Done and failed markers of jobs with an unchanged run key are kept, so re-creating resumes; all other
+        markers and payloads are removed.
+        """
+        queue = cls(root)
+        for kind in ['jobs', 'leases', 'done', 'failed']:
+            os.makedirs(os.path.join(queue.root, kind), exist_ok=True)
+        records = []
+        for job in jobs:
+            job_id = cls.job_id(job)
+            for kind in ['done', 'failed']:
+                marker = _read_json(queue._path(kind, job_id))
+                if marker is not None and marker.get('key') != job.get('run_key'):
+                    os.remove(queue._path(kind, job_id))
+            _write_pickle(queue._path('jobs', job_id, '.pkl'), (experiment, job))
+            records.append({'id': job_id, 'month': job['month'], 'demand': job['demand'], 'alg': job['algName'],
+                            'revenue': job['revenue'], 'path': job['path'], 'site': experiment.site,
+                            'results_db': experiment.store.path,
+                            'copies': [copy['path'] for copy in job.get('copies', [])]})
+        ids = {record['id'] for record in records}
+        for kind, ext in [('jobs', '.pkl'), ('done', '.json'), ('failed', '.json')]:
+            for name in os.listdir(os.path.join(queue.root, kind)):
+                if name.endswith(ext) and name[:-len(ext)] not in ids:
+                    os.remove(os.path.join(queue.root, kind, name))
+        _write_json(os.path.join(queue.root, MANIFEST), records)
+        print(f'Queued {len(records)} jobs in {queue.root}')
+        return queue
+
+    def manifest(self):
+        return _read_json(os.path.join(self.root, MANIFEST)) or []
+
+    def _lease_path(self, job_id, generation):
+        return self._path('leases', f'{job_id}.{generation}')
+
+    def _lease(self, job_id):
+        """ Number and content of the newest lease on job_id, (None, None) without one. """
+        prefix = job_id + '.'
+        generations = [int(name[len(prefix):-len('.json')]) for name in os.listdir(os.path.join(self.root, 'leases'))
+                       if name.startswith(prefix) and name.endswith('.json')]
+        if not generations:
+            return None, None
+        generation = max(generations)
+        return generation, _read_json(self._lease_path(job_id, generation))
+
+    def _lease_valid(self, job_id, now=None):
+        _, lease = self._lease(job_id)
+        return lease is not None and lease['expires'] > (now or time.time())
+
+    def state(self, job_id, now=None):
+        if os.path.exists(self._path('done', job_id)):
+            return 'done'
+        if os.path.exists(self._path('failed', job_id)):
+            return 'failed'
+        if self._lease_valid(job_id, now):
+            return 'running'
+        return 'pending'
+
+    def status(self):
+        now = time.time()
+        counts = {'done': 0, 'running': 0, 'failed': 0, 'pending': 0}
+        for record in self.manifest():
+            counts[self.state(record['id'], now)] += 1
+        return counts
+
+    def _claim(self, job_id, worker, lease_seconds):
+        """ Try to take the lease on job_id, taking over an expired one.
+
+        Returns:
+            int: Number of the lease taken, None if the job is held by another worker.
+        """
+        generation, lease = self._lease(job_id)
+        if generation is not None:
+            if lease is None or lease['expires'] > time.time():
+                return None
+            print(f'Lease of {lease["worker"]} on {job_id} expired, re-queued')
+            generation += 1
+        else:
+            generation = 0
+        lease_path = self._lease_path(job_id, generation)
+        tmp_path = f'{lease_path}.{worker}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'worker': worker, 'expires': time.time() + lease_seconds}, f)
+        try:
+            # the link fails if the name exists, so of all workers taking this number one wins
+            os.link(tmp_path, lease_path)
+        except FileExistsError:
+            return None
+        finally:
+            os.remove(tmp_path)
+        if self.state(job_id) in ['done', 'failed']:
+            # finished and released between our state check and the claim
+            self._release(job_id, generation)
+            return None
+        for older in range(generation):
+            self._release(job_id, older)
+        return generation
+
+    def _release(self, job_id, generation):
+        try:
+            os.remove(self._lease_path(job_id, generation))
+        except FileNotFoundError:
+            pass
+
+    def _renew(self, job_id, worker, generation, lease_seconds, stop):
+        """ Renew the lease until `stop` is set or a newer claim took the job over.
+
+        The lease file is rewritten even if it went missing, a failed write is retried at the next renewal.
+        """
+        while not stop.wait(lease_seconds / 3):
+            try:
+                newest, _ = self._lease(job_id)
+                if newest is not None and newest > generation:
+                    print(f'{worker} - {job_id} - lease taken over by a newer claim')
+                    return
+                _write_json(self._lease_path(job_id, generation), {'worker': worker, 'expires': time.time() + lease_seconds})
+            except OSError as e:
+                print(f'{worker} - {job_id} - lease renewal failed, retrying: {e}')
+
+    def _run(self, job_id, worker, generation, lease_seconds):
+        stop = threading.Event()
+        renewer = threading.Thread(target=self._renew, args=(job_id, worker, generation, lease_seconds, stop), daemon=True)
+        renewer.start()
+        job = {}
+        try:
+            with open(self._path('jobs', job_id, '.pkl'), 'rb') as f:
+                experiment, job = pickle.load(f)
+            status = experiment._run_job(job)
+            error = None
+        except Exception:
+            status, error = 'failed', traceback.format_exc()
+        finally:
+            stop.set()
+            renewer.join()
+        record = {'worker': worker, 'status': status, 'finished': time.time(), 'error': error, 'key': job.get('run_key')}
+        _write_json(self._path('failed' if status == 'failed' else 'done', job_id), record)
+        # only our own claim is removed, a worker that took the job over after an expiry holds a newer one
+        self._release(job_id, generation)
+        return status
+
+    def work(self, lease_seconds=900, poll_seconds=30):
+        """ Claim and run jobs until none is pending or running. """
+        worker = f'{socket.gethostname()}-{os.getpid()}'
+        while True:
+            ran = False
+            for record in self.manifest():
+                job_id = record['id']
+                generation = self._claim(job_id, worker, lease_seconds) if self.state(job_id) == 'pending' else None
+                if generation is None:
+                    continue
+                print(f'{worker} - {job_id} - {record["path"]}')
+                print(f'{worker} - {job_id} - {self._run(job_id, worker, generation, lease_seconds)}')
+                ran = True
+            counts = self.status()
+            if counts['pending'] == 0 and counts['running'] == 0:
+                print(f'{worker} finished: {counts}, run `python job_queue.py index {self.root}` to update the results store')
+                return counts
+            if not ran:
+                # everything left is held by other workers, wait for them or for their leases to expire
+                time.sleep(poll_seconds)
+
+    def index(self, results_db=None):
+        """ Add the runs of all done jobs and their copies to the results store, from a single process. """
+        from results_store import ResultsStore
+        stores, count = {}, 0
+        for record in self.manifest():
+            if self.state(record['id']) != 'done':
+                continue
+            path = results_db or record['results_db']
+            store = stores.setdefault(path, ResultsStore(path))
+            for run_path in [record['path']] + record['copies']:
+                count += store.index_run(run_path, record['site'])
+        print(f'Indexed {count} runs from {self.root}')
+        return count
+
+    def retry_failed(self):
+        for record in self.manifest():
+            if os.path.exists(self._path('failed', record['id'])):
+                os.remove(self._path('failed', record['id']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['worker', 'status', 'retry-failed', 'index'])
+    parser.add_argument('queue')
+    parser.add_argument('--lease', type=int, default=900, help='lease length in seconds')
+    parser.add_argument('--poll', type=int, default=30, help='seconds between checks when all jobs are taken')
+    parser.add_argument('--db', help='results store to index into, the one of the enqueuing experiment by default')
+    args = parser.parse_args()
+
+    queue = JobQueue(args.queue)
+    if args.command == 'worker':
+        queue.work(lease_seconds=args.lease, poll_seconds=args.poll)
+    elif args.command == 'status':
+        print(queue.status())
+    elif args.command == 'index':
+        queue.index(args.db)
+    else:
+        queue.retry_failed()
+        print(queue.status())
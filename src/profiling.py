@@ -0,0 +1,154 @@
+import os
+import sys
+import glob
+import json
+from time import perf_counter
+from contextlib import contextmanager
+
+import numpy as np
+
+from sim_hooks import hook, unhook
+
+PERCENTILES = [50, 90, 99]
+
+
+class SimProfiler:
+    """ Optional per-call instrumentation of a simulation.
+
+    Records, for every scheduler call, the number of active EVs, the CVXPY problem size and the time
+    spent building the model, in CVXPY (compilation + solver) and post-processing the solution.
+    It also records the duration of every simulator iteration and event, and the time spent writing
+    results. Use attach() before sim.run(), detach() before serializing the simulator.
+    """
+    def __init__(self):
+        self.schedule   = []
+        self.iterations = []
+        self.events     = []
+        self.writes     = {}
+        self._call      = None
+        self._sim       = None
+        self._end       = None
+
+    def attach(self, sim):
+        self._sim = sim
+        schedule_hook = hook(sim.scheduler, 'schedule')
+        schedule_hook.before.append(self._schedule_start)
+        schedule_hook.after.append(self._schedule_end)
+        hook(sim, '_process_event').after.append(self._event_end)
+        hook(sim.event_queue, 'get_current_events').before.append(self._iteration_start)
+
+    def detach(self, sim):
+        unhook(sim.scheduler, 'schedule')
+        unhook(sim, '_process_event')
+        unhook(sim.event_queue, 'get_current_events')
+        self._sim = None
+        self._end = perf_counter()
+
+    def _schedule_start(self, scheduler, args):
+        self._call = {'iteration': self._sim.iteration, 'active_evs': len(args[0]), 'start': perf_counter(),
+                      'cvxpy': 0.0, 'compilation': 0.0, 'solver': 0.0, 'variables': 0, 'constraints': 0}
+
+    def _schedule_end(self, scheduler, elapsed, args, result):
+        call = self._call
+        end = perf_counter()
+        call['total'] = elapsed
+        # everything before the first and after the last CVXPY solve
+        call['build'] = call.pop('first_solve', end) - call.pop('start')
+        call['post'] = end - call.pop('last_solve_end', end)
+        self.schedule.append(call)
+        self._call = None
+
+    def _solve(self, problem, start, end):
+        call = self._call
+        if call is None:
+            return
+        call.setdefault('first_solve', start)
+        call['last_solve_end'] = end
+        call['cvxpy'] += end - start
+        call['compilation'] += getattr(problem, 'compilation_time', None) or 0.0
+        call['solver'] += getattr(problem.solver_stats, 'solve_time', None) or 0.0
+        call['variables'] = max(call['variables'], problem.size_metrics.num_scalar_variables)
+        call['constraints'] = max(call['constraints'], problem.size_metrics.num_scalar_eq_constr
+                                  + problem.size_metrics.num_scalar_leq_constr)
+
+    @contextmanager
+    def record_cvxpy(self):
+        """ Time every cvxpy.Problem.solve made while the block runs. """
+        import cvxpy
+        original = cvxpy.Problem.solve
+        def solve(problem, *args, **kwargs):
+            start = perf_counter()
+            try:
+                return original(problem, *args, **kwargs)
+            finally:
+                self._solve(problem, start, perf_counter())
+        cvxpy.Problem.solve = solve
+        try:
+            yield self
+        finally:
+            cvxpy.Problem.solve = original
+
+    def _iteration_start(self, event_queue, args):
+        self.iterations.append(perf_counter())
+
+    def _event_end(self, sim, elapsed, args, result):
+        self.events.append({'iteration': sim.iteration, 'type': args[0].event_type, 'seconds': elapsed})
+
+    @contextmanager
+    def timed_write(self, name):
+        start = perf_counter()
+        yield
+        self.writes[name] = perf_counter() - start
+
+    def to_dict(self):
+        iterations = np.diff(self.iterations + [self._end or perf_counter()]).tolist() if self.iterations else []
+        return {'schedule': self.schedule, 'iterations': iterations, 'events': self.events, 'writes': self.writes}
+
+
+def summarize_profiles(results_dir, bins=(0, 5, 10, 20, 40, 80, 160, 10**6)):
+    """ Summarize every profile.json below results_dir.
+
+    Returns:
+        (pd.DataFrame, pd.DataFrame): Per-run totals, and percentiles of the scheduler timings
+            grouped by the number of active EVs.
+    """
+    import pandas as pd
+    runs, calls = [], []
+    for profile_path in glob.glob(os.path.join(str(results_dir), '**', 'profile.json'), recursive=True):
+        with open(profile_path) as f:
+            profile = json.load(f)
+        run = os.path.relpath(os.path.dirname(profile_path), str(results_dir))
+        schedule = pd.DataFrame(profile['schedule'])
+        schedule['run'] = run
+        calls.append(schedule)
+        runs.append({
+            'run'           : run,
+            'iterations'    : len(profile['iterations']),
+            'sim_seconds'   : sum(profile['iterations']),
+            'schedule_calls': len(schedule),
+            'build'         : schedule['build'].sum() if len(schedule) else 0.0,
+            'compilation'   : schedule['compilation'].sum() if len(schedule) else 0.0,
+            'solver'        : schedule['solver'].sum() if len(schedule) else 0.0,
+            'post'          : schedule['post'].sum() if len(schedule) else 0.0,
+            'events'        : sum(e['seconds'] for e in profile['events']),
+            'write'         : sum(profile['writes'].values()),
+        })
+    runs = pd.DataFrame(runs)
+    if not calls:
+        return runs, pd.DataFrame()
+
+    calls = pd.concat(calls, ignore_index=True)
+    calls['active_evs_bin'] = pd.cut(calls['active_evs'], bins=list(bins), right=False)
+    timings = calls.groupby('active_evs_bin', observed=True)[['total', 'build', 'compilation', 'solver', 'post']]
+    percentiles = timings.quantile([p / 100 for p in PERCENTILES]).unstack()
+    percentiles['calls'] = calls.groupby('active_evs_bin', observed=True).size()
+    return runs, percentiles
+
+
+if __name__ == '__main__':
+    # python profiling.py Output/Results/jpl
+    import pandas as pd
+    runs, percentiles = summarize_profiles(sys.argv[1])
+    pd.set_option('display.width', 200)
+    print(runs.to_string())
+    print(percentiles.to_string())
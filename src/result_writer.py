@@ -0,0 +1,47 @@
+import queue
+import threading
+import traceback
+
+
+class ResultWriter:
+    """ Background thread that stores finished runs while the next run simulates.
+
+    submit() blocks while `max_pending` runs are already waiting, which bounds the memory held by finished
+    simulators. A failed write is printed with its traceback and kept in `failures`; the done marker of a run is
+    written last, so the next sweep runs it again instead of trusting partial results.
+    """
+    def __init__(self, max_pending=1):
+        self.failures   = []
+        self.written    = 0
+        self._queue     = queue.Queue(maxsize=max_pending)
+        self._thread    = threading.Thread(target=self._work, name='ResultWriter')
+        self._thread.start()
+
+    def submit(self, path, fn, *args):
+        """ Call fn(*args) in the writer thread, `path` names the run in reports. """
+        self._queue.put((path, fn, args))
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, fn, args = item
+            try:
+                fn(*args)
+                self.written += 1
+                print(f'Written - {path}')
+            except Exception:
+                self.failures.append({'path': path, 'error': traceback.format_exc()})
+                print(f'Write failed - {path}')
+                print(self.failures[-1]['error'])
+
+    def close(self):
+        """ Wait for every pending write and stop the thread.
+
+        Returns:
+            list: {'path', 'error'} of every failed write.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        return self.failures
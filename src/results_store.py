@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import glob
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+KEY_COLUMNS     = ['site', 'start', 'end', 'tariff', 'revenue', 'scenario', 'alg']
+METRIC_COLUMNS  = ['proportion_delivered', 'demands_fully_met', 'peak_current', 'demand_charge',
+                   'energy_cost', 'total_energy_delivered', 'total_energy_requested']
+
+
+class ResultsStore:
+    """ Single SQLite table holding the metrics and solver statistics of every run.
+
+    Rows are keyed by (site, start, end, tariff, revenue, scenario, alg). Keys are stored as text so they
+    match the result directory names (dates as YYYY-MM-DD, revenue as str(revenue)). Only the path is
+    kept on the object, so a store can be pickled into worker processes; every call opens its own
+    connection and WAL mode lets those processes write concurrently. WAL needs a local filesystem; job queue
+    workers on several hosts therefore leave the store alone, see job_queue.py.
+    """
+    def __init__(self, path):
+        self.path = str(path)
+        with self._connect() as con:
+            con.execute(f"""CREATE TABLE IF NOT EXISTS runs (
+                {', '.join(f'"{c}" TEXT NOT NULL' for c in KEY_COLUMNS)},
+                {', '.join(f'"{c}" REAL' for c in METRIC_COLUMNS)},
+                solve_stats TEXT,
+                path        TEXT,
+                updated     TEXT,
+                PRIMARY KEY ({', '.join(f'"{c}"' for c in KEY_COLUMNS)})
+            )""")
+
+    @contextmanager
+    def _connect(self):
+        """ Connection that commits on success and is always closed. """
+        con = sqlite3.connect(self.path, timeout=60)
+        try:
+            con.execute('PRAGMA journal_mode=WAL')
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    @staticmethod
+    def _key(config):
+        return [str(config[c]) for c in KEY_COLUMNS]
+
+    def put(self, config, metrics, solve_stats=None, path=None):
+        """ Insert or replace the row for `config` (a dict with the KEY_COLUMNS). """
+        columns = KEY_COLUMNS + METRIC_COLUMNS + ['solve_stats', 'path', 'updated']
+        values  = self._key(config) + [metrics.get(c) for c in METRIC_COLUMNS] + [
+            json.dumps(solve_stats) if solve_stats is not None else None, path, datetime.now().isoformat()]
+        with self._connect() as con:
+            con.execute(f"""INSERT OR REPLACE INTO runs ({', '.join(f'"{c}"' for c in columns)})
+                            VALUES ({', '.join('?' for _ in columns)})""", values)
+
+    def _get(self, config, columns):
+        where = ' AND '.join(f'"{c}" = ?' for c in KEY_COLUMNS)
+        with self._connect() as con:
+            return con.execute(f"""SELECT {', '.join(f'"{c}"' for c in columns)} FROM runs WHERE {where}""",
+                               self._key(config)).fetchone()
+
+    def get_metric(self, config):
+        row = self._get(config, METRIC_COLUMNS)
+        return dict(zip(METRIC_COLUMNS, row)) if row is not None else {}
+
+    def get_solve_stats(self, config):
+        row = self._get(config, ['solve_stats'])
+        if row is None or row[0] is None:
+            return float('nan')
+        return json.loads(row[0])
+
+    def query(self, **filters):
+        """ Return all matching runs as a DataFrame.
+
+        Each keyword is a key column and either a single value or a list of accepted values,
+        e.g. query(site='jpl', alg=['Quick_charge', 'Profit']).
+        """
+        import pandas as pd
+        where, params = self._where(filters)
+        with self._connect() as con:
+            return pd.read_sql_query(f'SELECT * FROM runs {where}', con, params=params)
+
+    def records(self, **filters):
+        """ query() as a list of dicts, for callers that should not import pandas. """
+        where, params = self._where(filters)
+        with self._connect() as con:
+            cursor = con.execute(f'SELECT * FROM runs {where}', params)
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    @staticmethod
+    def _where(filters):
+        clauses, params = [], []
+        for column, value in filters.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            clauses.append(f'"{column}" IN ({", ".join("?" for _ in values)})')
+            params.extend(str(v) for v in values)
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ''), params
+
+    def index_run(self, path, site):
+        """ Import one run written by Experiment to <results_dir>/alg/start end/tariff/revenue/scenario.
+
+        Returns:
+            int: 1 if the run was imported, 0 if it has no metrics.json.
+        """
+        metrics_path = os.path.join(str(path), 'metrics.json')
+        if not os.path.exists(metrics_path):
+            return 0
+        alg, dates, tariff, revenue, scenario = os.path.normpath(str(path)).split(os.sep)[-5:]
+        start, end = dates.split(' ')
+        with open(metrics_path) as f:
+            metrics = json.load(f)
+        solve_stats = None
+        if os.path.exists(os.path.join(path, 'solve_stats.json')):
+            with open(os.path.join(path, 'solve_stats.json')) as f:
+                solve_stats = json.load(f)
+        config = {'site': site, 'start': start, 'end': end, 'tariff': tariff,
+                  'revenue': revenue, 'scenario': scenario, 'alg': alg}
+        self.put(config, metrics, solve_stats, str(path))
+        return 1
+
+    def index_directory(self, results_dir, site):
+        """ Import runs already written by Experiment to <results_dir>/alg/start end/tariff/revenue/scenario. """
+        count = 0
+        for metrics_path in glob.glob(os.path.join(str(results_dir), '*', '*', '*', '*', '*', 'metrics.json')):
+            count += self.index_run(os.path.dirname(metrics_path), site)
+        print(f'Indexed {count} runs from {results_dir}')
+
+if __name__ == '__main__':
+    # python results_store.py Output/Results/results.sqlite Output/Results/jpl jpl
+    ResultsStore(sys.argv[1]).index_directory(sys.argv[2], sys.argv[3])
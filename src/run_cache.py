@@ -0,0 +1,98 @@
+import os
+import json
+import hashlib
+import inspect
+import functools
+from importlib import metadata
+
+import numpy as np
+
+# Algorithm attributes that are run state rather than configuration.
+_VOLATILE_ATTRS = {'_interface', 'interface', 'solve_stats'}
+_PACKAGES       = ['acnportal', 'adacharge']
+
+
+def _describe(obj, _depth=0):
+    """ JSON-able, deterministic description of a configuration object.
+
+    Functions are described by their qualified name and source, objects by their class and attributes,
+    so objective components, their coefficients and kwargs all end up in the description.
+    """
+    if _depth > 20:
+        return repr(obj)
+    if obj is None or isinstance(obj, (str, bool, int, float)):
+        return obj
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (list, tuple)):
+        return [_describe(o, _depth + 1) for o in obj]
+    if isinstance(obj, dict):
+        return {str(k): _describe(v, _depth + 1) for k, v in sorted(obj.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(obj, functools.partial):
+        return {'partial': _describe(obj.func, _depth + 1), 'args': _describe(obj.args, _depth + 1),
+                'keywords': _describe(obj.keywords, _depth + 1)}
+    if callable(obj) and hasattr(obj, '__qualname__'):
+        name = f'{obj.__module__}.{obj.__qualname__}'
+        try:
+            # editing an objective function's body must invalidate its runs too
+            return {'function': name, 'source': hashlib.sha256(inspect.getsource(obj).encode()).hexdigest()}
+        except (OSError, TypeError):
+            return name
+    if hasattr(obj, '__dict__'):
+        description = {'class': f'{type(obj).__module__}.{type(obj).__qualname__}'}
+        for k, v in sorted(vars(obj).items()):
+            if k not in _VOLATILE_ATTRS:
+                description[k] = _describe(v, _depth + 1)
+        return description
+    return repr(obj)
+
+
+def _package_versions():
+    versions = {}
+    for package in _PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def run_config(alg, scenario, event_hash, period, voltage, tariff_name, start, end, options=None):
+    """ Everything that can change the outcome of a simulation.
+
+    Events are hashed relative to the simulation start, so `start` and `end` are part of the key: ToU prices,
+    demand charges and the tariff horizon depend on the calendar dates, not only on the events.
+
+    `options` holds experiment-level switches that change results, e.g. schedule reuse. It is left out when
+    empty, so runs without options keep their keys.
+    """
+    config = {
+        'alg'       : _describe(alg),
+        'scenario'  : _describe(scenario),
+        'events'    : event_hash,
+        'period'    : period,
+        'voltage'   : voltage,
+        'tariff'    : tariff_name,
+        'start'     : start.isoformat(),
+        'end'       : end.isoformat(),
+        'versions'  : _package_versions(),
+    }
+    if options:
+        config['options'] = _describe(options)
+    return config
+
+
+def run_key(config):
+    """ Content hash of a run configuration from run_config(). """
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+def stored_run_key(path):
+    """ Key of the run stored in `path`, or None for missing or pre-key runs. """
+    try:
+        with open(os.path.join(path, 'run_key.json')) as f:
+            return json.load(f)['key']
+    except (OSError, ValueError, KeyError):
+        return None
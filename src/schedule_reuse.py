@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class ScheduleReuse:
+    """ Picklable stand-in for a scheduler's schedule() that skips solves whose answer is already known.
+
+    With max_recompute=1 an AdaptiveSchedulingAlgorithm rebuilds, compiles and solves its CVXPY problem every
+    period, although between arrivals and departures the problem it sees is the previous one shifted by a period.
+    As long as the set of active sessions is unchanged and every EV received exactly the energy the previous
+    schedule planned for it, the tail of that schedule is still the optimal plan, so it is returned instead of
+    solving again. Any arrival, departure or shortfall (e.g. a battery in its tapering stage) triggers a solve.
+
+    Objectives may also depend on the current time itself rather than on the remaining horizon only, e.g.
+    days_remaining_scale_demand_charge on the day index and ToU terms on the current price. A schedule is never
+    reused across a day boundary or a change of the ToU price, and max_age bounds how many periods it is reused.
+    """
+    def __init__(self, scheduler, max_age=12, tolerance=1e-3):
+        self.obj        = scheduler
+        self.max_age    = max_age
+        self.tolerance  = tolerance     # A*periods
+        self.solves     = 0
+        self.reuses     = 0
+        self._plan      = None          # (time, {session_id: remaining A*periods}, schedule)
+
+    @classmethod
+    def install(cls, scheduler, **kwargs):
+        reuse = cls(scheduler, **kwargs)
+        scheduler.schedule = reuse
+        return reuse
+
+    @staticmethod
+    def uninstall(scheduler):
+        """ Remove the ScheduleReuse from scheduler.schedule, e.g. before serializing the simulator. """
+        if isinstance(vars(scheduler).get('schedule'), ScheduleReuse):
+            del scheduler.schedule
+
+    def __call__(self, active_sessions):
+        interface   = self.obj.interface
+        now         = interface.current_time
+        schedule    = self._reuse(interface, active_sessions, now)
+        if schedule is not None:
+            self.reuses += 1
+            return schedule
+        schedule = type(self.obj).schedule(self.obj, active_sessions)
+        self.solves += 1
+        remaining = {s.session_id: interface.remaining_amp_periods(s) for s in active_sessions}
+        self._plan = (now, remaining, schedule)
+        return schedule
+
+    def _reuse(self, interface, active_sessions, now):
+        """ Tail of the previous schedule, or None if it may no longer be optimal. """
+        if self._plan is None or not active_sessions:
+            return None
+        time, remaining, schedule = self._plan
+        age = now - time
+        if not 0 < age <= self.max_age or {s.session_id for s in active_sessions} != set(remaining):
+            return None
+        if self._crosses_boundary(interface, time, now):
+            return None
+        if any(len(rates) <= age for rates in schedule.values()):
+            return None
+        for session in active_sessions:
+            planned = np.sum(schedule[session.station_id][:age])
+            if abs(remaining[session.session_id] - planned - interface.remaining_amp_periods(session)) > self.tolerance:
+                return None
+        return {station_id: rates[age:] for station_id, rates in schedule.items()}
+
+    @staticmethod
+    def _crosses_boundary(interface, time, now):
+        """ Whether a new day started or the ToU price changed in (time, now]. """
+        # days are counted from the simulation start, as days_remaining_scale_demand_charge does
+        per_day = 24 * 60 // interface.period
+        if time // per_day != now // per_day:
+            return True
+        try:
+            prices = interface.get_prices(now - time + 1, start=time)
+        except ValueError:
+            # simulation without a tariff signal
+            return False
+        return bool(np.any(prices != prices[0]))
+
+    def stats(self):
+        calls = self.solves + self.reuses
+        return {'solves': self.solves, 'reuses': self.reuses, 'reuse_rate': self.reuses / calls if calls else 0.0}
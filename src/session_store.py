@@ -0,0 +1,125 @@
+import os
+import json
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytz
+
+
+class SessionStore:
+    """ Local copy of raw ACN-Data sessions, one Parquet file per site and day.
+
+    Sessions are partitioned by the local date of their connectionTime under <root>/<site>/<YYYY-MM-DD>.parquet.
+    A day file is written for every downloaded day, including days without sessions, so only dates without a
+    file are ever requested again. Days that are not over yet are never stored.
+
+    `client` is anything with DataClient's get_sessions_by_time(site, start, end), which allows testing against
+    a local stub. `client_fn` creates the client on first use instead, so fully cached runs need no API key.
+    Writing Parquet requires pyarrow (or fastparquet).
+    """
+    def __init__(self, root, client=None, client_fn=None, timezone=pytz.timezone('America/Los_Angeles'), max_workers=4):
+        self.root           = str(root)
+        self._client        = client
+        self._client_fn     = client_fn
+        self.timezone       = timezone
+        self.max_workers    = max_workers
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._client_fn()
+        return self._client
+
+    def _day_path(self, site, day):
+        return os.path.join(self.root, site, f'{day.isoformat()}.parquet')
+
+    @staticmethod
+    def _days(start, end):
+        """ Local dates covered by the naive interval [start, end). """
+        day = start.date()
+        while datetime.combine(day, datetime.min.time()) < end:
+            yield day
+            day += timedelta(days=1)
+
+    def missing_ranges(self, site, start, end):
+        """ Contiguous (first_day, last_day) ranges of [start, end) without a local day file, split at months. """
+        return self._missing_ranges(site, [(start, end)])
+
+    def _missing_ranges(self, site, intervals):
+        """ Missing day ranges of all intervals, split at interval starts and month boundaries.
+
+        Each range is downloaded by one request, so splitting keeps back-to-back intervals and long intervals
+        from turning into a single sequential download.
+        """
+        days    = sorted({day for start, end in intervals for day in self._days(start, end)
+                          if not os.path.exists(self._day_path(site, day))})
+        breaks  = {start.date() for start, _ in intervals}
+        ranges  = []
+        for day in days:
+            if ranges and ranges[-1][1] + timedelta(days=1) == day and day not in breaks and day.day != 1:
+                ranges[-1][1] = day
+            else:
+                ranges.append([day, day])
+        return [tuple(r) for r in ranges]
+
+    def _download(self, site, first_day, last_day):
+        """ Download [first_day, last_day] in one request and write a file per finished day. """
+        start   = self.timezone.localize(datetime.combine(first_day, datetime.min.time()))
+        end     = self.timezone.localize(datetime.combine(last_day + timedelta(days=1), datetime.min.time()))
+        df      = pd.DataFrame.from_dict(list(self.client.get_sessions_by_time(site, start, end)))
+        today   = datetime.now(self.timezone).date()
+
+        days = pd.to_datetime(df['connectionTime'], utc=True).dt.tz_convert(self.timezone).dt.date if len(df) else pd.Series(dtype=object)
+        os.makedirs(os.path.join(self.root, site), exist_ok=True)
+        for day in self._days(start.replace(tzinfo=None), end.replace(tzinfo=None)):
+            if day >= today:
+                continue
+            self._write_day(site, day, df[(days == day).to_numpy()] if len(df) else df)
+        print(f'Downloaded {site} {first_day} -- {last_day}: {len(df)} sessions')
+
+    def _write_day(self, site, day, df):
+        df = df.copy()
+        if 'userInputs' in df:
+            # nested list of dicts, stored as JSON text so the Parquet schema stays flat
+            df['userInputs'] = [json.dumps(u, default=str) if u is not None else None for u in df['userInputs']]
+        path = self._day_path(site, day)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def fetch(self, site, intervals):
+        """ Download every missing day of the given (start, end) intervals, the ranges concurrently. """
+        ranges = self._missing_ranges(site, intervals)
+        if not ranges:
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for future in [pool.submit(self._download, site, first_day, last_day) for first_day, last_day in ranges]:
+                future.result()
+
+    def get_sessions(self, site, start, end):
+        """ Sessions connected in [start, end), downloading missing days first. """
+        self.fetch(site, [(start, end)])
+        frames = []
+        for day in self._days(start, end):
+            path = self._day_path(site, day)
+            if os.path.exists(path):
+                frames.append(pd.read_parquet(path))
+            else:
+                # today or later: never stored, always downloaded fresh
+                first = self.timezone.localize(datetime.combine(day, datetime.min.time()))
+                last = self.timezone.localize(datetime.combine(day + timedelta(days=1), datetime.min.time()))
+                frames.append(pd.DataFrame.from_dict(list(self.client.get_sessions_by_time(site, first, last))))
+        frames = [frame for frame in frames if len(frame)]
+        if not frames:
+            return pd.DataFrame()
+        df = pd.concat(frames, ignore_index=True)
+        if 'userInputs' in df:
+            df['userInputs'] = [json.loads(u) if isinstance(u, str) else u for u in df['userInputs']]
+        for column in ['connectionTime', 'disconnectTime', 'doneChargingTime']:
+            if column in df:
+                df[column] = pd.to_datetime(df[column], utc=True).dt.tz_convert(self.timezone)
+        # keep the exact interval, days are only the storage unit
+        connection = df['connectionTime']
+        df = df[(connection >= self.timezone.localize(start)) & (connection < self.timezone.localize(end))]
+        return df.reset_index(drop=True)
@@ -0,0 +1,53 @@
+from time import perf_counter
+
+
+class MethodHook:
+    """ Picklable stand-in for a bound method that notifies listeners around every call.
+
+    Installed as an instance attribute, so it shadows the class method for this object only.
+    The original method is looked up on the class, which keeps the hook picklable and lets
+    several listeners share one hook. A callable already installed on the instance, e.g. a
+    ScheduleReuse, is wrapped instead and put back by unhook().
+
+    Listeners:
+        before(obj, args)
+        after(obj, elapsed, args, result), elapsed in seconds.
+    """
+    def __init__(self, obj, name, inner=None):
+        self.obj    = obj
+        self.name   = name
+        self.inner  = inner
+        self.before = []
+        self.after  = []
+
+    def __call__(self, *args, **kwargs):
+        for listener in self.before:
+            listener(self.obj, args)
+        start   = perf_counter()
+        if self.inner is not None:
+            result = self.inner(*args, **kwargs)
+        else:
+            result = getattr(type(self.obj), self.name)(self.obj, *args, **kwargs)
+        elapsed = perf_counter() - start
+        for listener in self.after:
+            listener(self.obj, elapsed, args, result)
+        return result
+
+
+def hook(obj, name):
+    """ Install a MethodHook on obj.name, or return the one already installed. """
+    method_hook = vars(obj).get(name)
+    if not isinstance(method_hook, MethodHook):
+        method_hook = MethodHook(obj, name, inner=method_hook)
+        setattr(obj, name, method_hook)
+    return method_hook
+
+
+def unhook(obj, name):
+    """ Remove the MethodHook from obj.name, e.g. before serializing obj. """
+    method_hook = vars(obj).get(name)
+    if isinstance(method_hook, MethodHook):
+        if method_hook.inner is not None:
+            setattr(obj, name, method_hook.inner)
+        else:
+            delattr(obj, name)
@@ -0,0 +1,141 @@
+import io
+import os
+import gzip
+import json
+from contextlib import contextmanager
+
+import numpy as np
+
+# Arrays written next to sim.json by Experiment, see write_sim_arrays().
+SIM_ARRAYS = ['charging_rates', 'pilot_signals', 'aggregate_current', 'station_ids']
+# Serialized simulator per compression, see Experiment(compression=...).
+SIM_FILES = {None: 'sim.json', 'gzip': 'sim.json.gz', 'zstd': 'sim.json.zst'}
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compression requires the zstandard package, use compression='gzip' otherwise")
+    return zstandard
+
+
+def find_sim_json(path):
+    """ Path of the serialized simulator in the run directory `path`, whatever its compression, or None. """
+    for name in SIM_FILES.values():
+        if os.path.exists(os.path.join(path, name)):
+            return os.path.join(path, name)
+    return None
+
+
+@contextmanager
+def open_sim_json(file_path):
+    """ Open sim.json, sim.json.gz or sim.json.zst for reading as text. """
+    if file_path.endswith('.gz'):
+        with gzip.open(file_path, 'rt') as f:
+            yield f
+    elif file_path.endswith('.zst'):
+        with open(file_path, 'rb') as raw:
+            with _zstandard().ZstdDecompressor().stream_reader(raw) as reader:
+                yield io.TextIOWrapper(reader)
+    else:
+        with open(file_path) as f:
+            yield f
+
+
+@contextmanager
+def compressed_text(raw, compression):
+    """ Text stream that writes into the binary file `raw`, compressed with 'gzip' or 'zstd'. `raw` is left open. """
+    if compression == 'gzip':
+        stream = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6)
+    elif compression == 'zstd':
+        stream = _zstandard().ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+    else:
+        raise ValueError(f'Unknown compression {compression}')
+    f = io.TextIOWrapper(stream)
+    yield f
+    f.flush()
+    f.detach()
+    stream.close()
+
+
+def sim_arrays(sim):
+    """ The SIM_ARRAYS of a finished simulation. """
+    return {
+        'charging_rates'    : sim.charging_rates,
+        'pilot_signals'     : sim.pilot_signals,
+        'aggregate_current' : sim.charging_rates.sum(axis=0),
+        'station_ids'       : np.array(sim.network.station_ids, dtype=str),
+    }
+
+
+def write_arrays(arrays, path, open_fn=open):
+    """ Store SIM_ARRAYS as .npy files in `path`. """
+    for name, array in arrays.items():
+        with open_fn(os.path.join(path, name + '.npy'), 'wb') as f:
+            np.save(f, array)
+
+
+def write_sim_arrays(sim, path, open_fn=open):
+    """ Store the large simulator arrays of a finished run as .npy files in `path`. """
+    write_arrays(sim_arrays(sim), path, open_fn)
+
+
+class SimResult:
+    """ Lazy reader for a stored run.
+
+    The arrays are memory-mapped from the .npy sidecars on first access, so many month-long runs can
+    be compared without deserializing them. The full acnsim.Simulator is only built by simulator().
+    Runs stored before the sidecars existed fall back to reading the arrays from sim.json.
+    Compressed sim.json.gz and sim.json.zst are read transparently.
+    """
+    def __init__(self, path):
+        self.path       = str(path)
+        self._arrays    = {}
+
+    def __repr__(self):
+        return f'SimResult({self.path!r})'
+
+    def exists(self):
+        return find_sim_json(self.path) is not None
+
+    def _array(self, name):
+        if name not in self._arrays:
+            npy_path = os.path.join(self.path, name + '.npy')
+            if os.path.exists(npy_path):
+                self._arrays[name] = np.load(npy_path, mmap_mode='r')
+            else:
+                self._arrays.update(sim_arrays(self.simulator()))
+        return self._arrays[name]
+
+    @property
+    def charging_rates(self):
+        return self._array('charging_rates')
+
+    @property
+    def pilot_signals(self):
+        return self._array('pilot_signals')
+
+    @property
+    def aggregate_current(self):
+        return self._array('aggregate_current')
+
+    @property
+    def station_ids(self):
+        return self._array('station_ids')
+
+    @property
+    def metrics(self):
+        with open(os.path.join(self.path, 'metrics.json')) as f:
+            return json.load(f)
+
+    @property
+    def solve_stats(self):
+        with open(os.path.join(self.path, 'solve_stats.json')) as f:
+            return json.load(f)
+
+    def simulator(self):
+        """ Deserialize the full Simulator. This is the expensive path. """
+        from acnportal import acnsim
+        with open_sim_json(find_sim_json(self.path)) as f:
+            return acnsim.Simulator.from_json(f)
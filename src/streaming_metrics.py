@@ -0,0 +1,66 @@
+import numpy as np
+
+from sim_hooks import hook, unhook
+
+
+class MetricsCollector:
+    """ Incremental version of Experiment._calc_metrics.
+
+    Hooks into every simulator step and keeps running totals of delivered energy, peak aggregate
+    current and power, and ToU energy cost, so the metrics never need a pass over the charging-rate
+    history. The per-session metrics are read from the EVs themselves at the end of the run.
+    """
+    def __init__(self, threshold=0.1):
+        self.threshold          = threshold     # kWh, see analysis.proportion_of_demands_met
+        self.peak_current       = 0.0
+        self.peak_power         = 0.0
+        self.energy             = 0.0
+        self.energy_cost        = 0.0
+        self.steps              = 0
+        self._tariff            = None
+        self._prices            = np.zeros(0)
+        self._voltages          = None
+
+    def attach(self, sim):
+        self._voltages  = np.asarray(sim.network._voltages, dtype=float)
+        self._tariff    = sim.signals.get('tariff') if sim.signals else None
+        hook(sim, '_store_actual_charging_rates').after.append(self._step)
+
+    def detach(self, sim):
+        unhook(sim, '_store_actual_charging_rates')
+
+    def _price(self, sim, iteration):
+        if iteration >= len(self._prices):
+            # extend the price vector in blocks, one day of periods at a time
+            length = max(iteration + 1, len(self._prices) + int(24 * 60 / sim.period))
+            self._prices = np.array(self._tariff.get_tariffs(sim.start, length, sim.period))
+        return self._prices[iteration]
+
+    def _step(self, sim, elapsed, args, result):
+        rates   = sim.network.current_charging_rates
+        power   = float(self._voltages.dot(rates)) / 1000    # kW
+        energy  = power * sim.period / 60                     # kWh
+        self.peak_current = max(self.peak_current, float(np.sum(rates)))
+        self.peak_power = max(self.peak_power, power)
+        self.energy += energy
+        if self._tariff is not None:
+            self.energy_cost += self._price(sim, sim.iteration) * energy
+        self.steps += 1
+
+    def metrics(self, sim):
+        """ Same keys and values as Experiment._calc_metrics. """
+        evs         = sim.ev_history.values()
+        requested   = sum(ev.requested_energy for ev in evs)
+        delivered   = sum(ev.energy_delivered for ev in evs)
+        met         = sum(1 for ev in evs if ev.remaining_demand < self.threshold)
+        if self._tariff is None:
+            raise ValueError("No pricing method is specified.")
+        return {
+            'proportion_delivered': delivered / requested * 100,
+            'demands_fully_met': met / len(sim.ev_history) * 100,
+            'peak_current': self.peak_current,
+            'demand_charge': self._tariff.get_demand_charge(sim.start) * self.peak_power,
+            'energy_cost': self.energy_cost,
+            'total_energy_delivered': delivered,
+            'total_energy_requested': requested
+        }
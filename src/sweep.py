@@ -0,0 +1,186 @@
+""" Run a sweep described by a JSON config file.
+
+    python sweep.py sweep.json [--dry-run] [--workers 4] [--queue Output/Queue/sweep1] [--screen 3]
+
+Example config:
+    {
+        "sites": ["jpl"],
+        "intervals": {"October": ["2019-10-01", "2019-11-01"]},
+        "scenarios": {"TrueValue": {"estimate_max_rate": false, "uninterrupted_charging": false,
+                                    "quantized": false, "basic_evse": true, "offline": false}},
+        "algorithms": {
+            "Quick_charge": {"class": "adacharge.AdaptiveSchedulingAlgorithm",
+                             "objective": [{"function": "adacharge.quick_charge"},
+                                           {"function": "adacharge.equal_share", "coefficient": 1e-12}],
+                             "kwargs": {"solver": "ECOS", "max_recompute": 1}},
+            "EDF": {"class": "acnportal.algorithms.SortedSchedulingAlgo",
+                    "args": ["@acnportal.algorithms.earliest_deadline_first"]}
+        },
+        "tariff": "sce_tou_ev_4_march_2019",
+        "revenue": [0.3, 0.5],
+        "options": {"periods": 5, "reuse_schedules": true}
+    }
+
+"options" are Experiment keyword arguments. Strings starting with "@" are imported objects. The string "revenue"
+as a coefficient, argument or keyword value is replaced by the revenue of the run. Objective functions have to be
+importable, e.g. from a module next to this file, so that the algorithms can be pickled to workers.
+
+The solver stack (adacharge, CVXPY) is only imported when the algorithms are built, acnportal only once a simulation
+is set up. --dry-run builds no algorithms and imports neither, nor pandas.
+"""
+import os
+import json
+import math
+import argparse
+import importlib
+import statistics
+from datetime import datetime
+from functools import partial
+
+
+def _import(path):
+    module, _, name = path.rpartition('.')
+    return getattr(importlib.import_module(module), name)
+
+
+def _resolve(value, revenue):
+    if value == 'revenue':
+        return revenue
+    if isinstance(value, str) and value.startswith('@'):
+        return _import(value[1:])
+    return value
+
+
+def build_algorithm(spec, revenue):
+    """ Scheduling algorithm from its config spec, see the module docstring. """
+    cls     = _import(spec['class'])
+    args    = [_resolve(arg, revenue) for arg in spec.get('args', [])]
+    kwargs  = {k: _resolve(v, revenue) for k, v in spec.get('kwargs', {}).items()}
+    if 'objective' in spec:
+        ObjectiveComponent = _import('adacharge.ObjectiveComponent')
+        args.insert(0, [ObjectiveComponent(_import(c['function']), _resolve(c.get('coefficient', 1), revenue),
+                                           {k: _resolve(v, revenue) for k, v in c.get('kwargs', {}).items()})
+                        for c in spec['objective']])
+    return cls(*args, **kwargs)
+
+
+def build_algorithms(specs, revenue):
+    return {name: build_algorithm(spec, revenue) for name, spec in specs.items()}
+
+
+def load_config(path):
+    with open(path) as f:
+        config = json.load(f)
+    config['sites'] = config.get('sites') or [config['site']]
+    config['intervals'] = {month: [datetime.fromisoformat(start), datetime.fromisoformat(end)]
+                           for month, (start, end) in config['intervals'].items()}
+    config.setdefault('options', {})
+    return config
+
+
+def _solve_seconds(solve_stats):
+    calls = json.loads(solve_stats) if solve_stats else None
+    if not isinstance(calls, list) or not calls:
+        return float('nan')
+    return sum(call.get('solve_time') or 0.0 for call in calls if isinstance(call, dict))
+
+
+def _seconds_per_day(store, site, algs):
+    """ Median solver seconds per simulated day of the stored runs of every algorithm. """
+    per_alg = {}
+    for run in store.records(site=site, alg=list(algs)):
+        days = (datetime.fromisoformat(run['end']) - datetime.fromisoformat(run['start'])).days or 1
+        seconds = _solve_seconds(run['solve_stats']) / days
+        if not math.isnan(seconds):
+            per_alg.setdefault(run['alg'], []).append(seconds)
+    return {alg: statistics.median(seconds) for alg, seconds in per_alg.items()}
+
+
+def _print_table(rows, columns):
+    cells   = [[str(column) for column in columns]] + [['' if row[c] is None else str(row[c]) for c in columns] for row in rows]
+    widths  = [max(len(line[k]) for line in cells) for k in range(len(columns))]
+    for line in cells:
+        print('  '.join(cell.rjust(width) for cell, width in zip(line, widths)))
+
+
+def dry_run(config):
+    """ Print the expanded job plan with its cache status and estimated solver time, without building algorithms.
+
+    Only the planning modules are imported, not experiment.py, acnportal or pandas. Status is 'stored' (done
+    marker present; a changed configuration is only detected when the sweep runs), 'resumable' (checkpoint
+    present), 'shared' (same algorithm spec, scenario and interval as an earlier job, unless the spec uses the
+    revenue) or 'to run'.
+    """
+    import numpy as np
+    from job_plan import plan_jobs, done_marker
+    from checkpoint import CHECKPOINT_FILE
+    from event_store import EVENTS_EXT
+    from results_store import ResultsStore
+    from utility import _event_store_path, getEVENTS_DIR, getRESULT_DIR, getRESULTS_DB
+
+    options         = config['options']
+    metrics_only    = bool(options.get('metrics_only') or options.get('chunk_days'))
+    specs           = config['algorithms']
+    store           = ResultsStore(getRESULTS_DB())
+    rows = []
+    for site in config['sites']:
+        jobs    = plan_jobs(getRESULT_DIR(site), config['intervals'], config['scenarios'], specs, config['tariff'], config['revenue'])
+        per_day = _seconds_per_day(store, site, specs)
+        seen    = set()
+        for job in jobs:
+            spec = json.dumps(specs[job['algName']], sort_keys=True)
+            key  = (spec.replace('"revenue"', str(job['revenue'])), job['demand'], job['start'], job['end'])
+            events = _event_store_path(getEVENTS_DIR(site), job['start'], job['end'], demand_name=str(job['demand'])) + EVENTS_EXT
+            if done_marker(job['path'], metrics_only) is not None:
+                status = 'stored'
+            elif key in seen:
+                status = 'shared'
+            elif os.path.exists(os.path.join(job['path'], CHECKPOINT_FILE)):
+                status = 'resumable'
+            else:
+                status = 'to run'
+            seen.add(key)
+            days = (job['end'] - job['start']).days
+            estimate = per_day.get(job['algName']) if status in ['to run', 'resumable'] else 0.0
+            rows.append({'site': site, 'month': job['month'], 'demand': job['demand'], 'alg': job['algName'],
+                         'revenue': job['revenue'], 'days': days,
+                         'sessions': len(np.load(events, mmap_mode='r')) if os.path.exists(events) else None,
+                         'status': status, 'est_seconds': None if estimate is None else round(estimate * days, 1)})
+    _print_table(rows, ['site', 'month', 'demand', 'alg', 'revenue', 'days', 'sessions', 'status', 'est_seconds'])
+    counts = {}
+    for row in rows:
+        counts[row['status']] = counts.get(row['status'], 0) + 1
+    print(', '.join(f'{status}: {count}' for status, count in counts.items()))
+    unknown = sum(1 for row in rows if row['est_seconds'] is None)
+    print(f"Estimated solver time: {sum(row['est_seconds'] or 0.0 for row in rows):.0f} s"
+          + (f" + {unknown} jobs of algorithms without stored runs" if unknown else ''))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('config', help='JSON sweep config')
+    parser.add_argument('--dry-run', action='store_true', help='print the job plan without running anything')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--queue', help='only write a job queue per site to QUEUE/<site>, see job_queue.py')
+    parser.add_argument('--screen', type=int, metavar='K', help='screen all algorithms first, run the K best')
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    if args.dry_run:
+        return dry_run(config)
+
+    from experiment import Experiment
+    algs = partial(build_algorithms, config['algorithms'])
+    for site in config['sites']:
+        ex = Experiment(site, config['intervals'], config['scenarios'], **config['options'])
+        if args.queue:
+            ex.enqueue(os.path.join(args.queue, site), algs, config['tariff'], config['revenue'])
+        elif args.screen:
+            ex.screen(algs, config['tariff'], config['revenue'], top_k=args.screen, workers=args.workers)
+        else:
+            ex.run(algs, config['tariff'], config['revenue'], workers=args.workers)
+
+
+if __name__ == '__main__':
+    main()
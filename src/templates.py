@@ -0,0 +1,68 @@
+from copy import deepcopy
+from datetime import timedelta
+
+import numpy as np
+from acnportal.signals.tariffs import TimeOfUseTariff
+
+# Per-process prototypes, built on first use.
+_NETWORKS   = {}
+_TARIFFS    = {}
+
+
+def network(site, voltage=208, basic_evse=True):
+    """ Fresh charging network of `site`, cloned from a per-process prototype.
+
+    The constraint matrix and the other constant arrays are shared by every clone: ChargingNetwork only
+    ever rebinds them when the network is built, never changes them in place. EVSEs are copied.
+    """
+    key = (site, voltage, basic_evse)
+    if key not in _NETWORKS:
+        # acnsim loads scikit-learn, import it only once a network is needed
+        from acnportal import acnsim
+        if site == 'jpl':
+            _NETWORKS[key] = acnsim.sites.jpl_acn(voltage=voltage, basic_evse=basic_evse)
+        elif site == 'caltech':
+            _NETWORKS[key] = acnsim.sites.caltech_acn(voltage=voltage, basic_evse=basic_evse)
+        else:
+            raise ValueError(f'No network template for site {site}')
+    prototype = _NETWORKS[key]
+    memo = {id(value): value for value in vars(prototype).values() if isinstance(value, np.ndarray)}
+    return deepcopy(prototype, memo)
+
+
+class TariffTable(TimeOfUseTariff):
+    """ TimeOfUseTariff with the prices and demand charges of a horizon precomputed as NumPy arrays.
+
+    TimeOfUseTariff looks every period up in its schedules, and optimizers with a ToU cost term ask for the
+    prices of their whole horizon at every solve. Requests on the precomputed grid are answered with a slice
+    of `prices`; anything else falls back to TimeOfUseTariff.
+    """
+    def __init__(self, tariff_name, start, days, period):
+        super().__init__(tariff_name)
+        self.table_start    = start
+        self.table_period   = period
+        self.prices         = np.array(TimeOfUseTariff.get_tariffs(self, start, days * 24 * 60 // period, period))
+        self.demand_charges = {(start + timedelta(days=d)).date(): TimeOfUseTariff.get_demand_charge(self, start + timedelta(days=d))
+                               for d in range(days)}
+
+    def get_tariffs(self, start, length, period):
+        offset = (start - self.table_start) / timedelta(minutes=period)
+        if period == self.table_period and offset == int(offset) and 0 <= offset and offset + length <= len(self.prices):
+            return self.prices[int(offset): int(offset) + length]
+        return super().get_tariffs(start, length, period)
+
+    def get_demand_charge(self, date_time):
+        if date_time.date() in self.demand_charges:
+            return self.demand_charges[date_time.date()]
+        return super().get_demand_charge(date_time)
+
+
+def tariff(tariff_name, start, days, period):
+    """ Shared TariffTable of a tariff over `days` days from `start`, built once per process.
+
+    The table is never modified by a simulation, so all runs with the same horizon use the same object.
+    """
+    key = (tariff_name, start, days, period)
+    if key not in _TARIFFS:
+        _TARIFFS[key] = TariffTable(tariff_name, start, days, period)
+    return _TARIFFS[key]
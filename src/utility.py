@@ -1,14 +1,12 @@
 import os
+import tempfile
+from contextlib import contextmanager
 from pathlib import Path
-from datetime import datetime, timedelta
-import json
 
-from acnportal import acnsim
-from acnportal.acnsim.models.ev import EV
-from acnportal.acnsim.events.acndata_events import _datetime_to_timestamp
-from acnportal.acnsim.models.battery import Battery
-from acnportal.acnsim.events.event import PluginEvent
-from acnportal.acnsim.events.event_queue import EventQueue
+import numpy as np
+from event_store import EventStore
+
+# pandas and acnportal (which loads scikit-learn) are only imported where events are built from sessions
 
 
 def getEVENTS_DIR(site:str):
@@ -25,121 +23,171 @@ def getRESULT_DIR(site:str):
     
     return EVENTS_DIR
 
-def _pandas_toEvent(timezone, EVENTS_DIR, df, start, end, period, voltage, ideal_battery = False, max_len=None, force_feasible=False, demand_name=""):
-    def _convert_to_ev_with_estimated(
-        d,
-        offset,
-        period,
-        voltage,
-        max_battery_power,
-        max_len=None,
-        battery_params=None,
-        force_feasible=False,
-    ):
-        """ Convert a json document for a single charging session from acndata into an EV object.
-
-        Args:
-            d (dict): Session expressed as a dictionary. See acndata API for more details.
-            offset (int): Simulation timestamp of the beginning of the simulation.
-            See get_evs() for additional args.
-
-        Returns:
-            EV: EV object with data from the acndata session doc.
-        """
-        arrival   = _datetime_to_timestamp(d["connectionTime"], period) - offset
-        departure = _datetime_to_timestamp(d["disconnectTime"], period) - offset
+def getSESSIONS_DIR():
+    curDir          = Path.cwd()
+    SESSIONS_DIR    = curDir.joinpath(curDir,"Output","Sessions")
+    SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
 
-        if max_len is not None and departure - arrival > max_len:
-            departure = arrival + max_len
+    return SESSIONS_DIR
 
-        # requested_energy = d['kWhDelivered'] * 1000 * (60 / period) / voltage  # A*periods
+def getRESULTS_DB():
+    curDir          = Path.cwd()
+    RESULTS_DIR     = curDir.joinpath(curDir,"Output","Results")
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
-        if force_feasible:
-            delivered_energy = min(
-                d["kWhDelivered"], max_battery_power * (departure - arrival) * (period / 60)
-            )
-        else:
-            delivered_energy = d["kWhDelivered"]
+    return RESULTS_DIR.joinpath("results.sqlite")
 
-        session_id = d["sessionID"]
-        station_id = d["spaceID"]
+def getSCREENING_DB():
+    curDir          = Path.cwd()
+    RESULTS_DIR     = curDir.joinpath(curDir,"Output","Results")
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+
+    return RESULTS_DIR.joinpath("screening.sqlite")
+
+# (site, start, end, demand_name, period, voltage, ideal_battery, max_len, force_feasible) -> EventStore
+_EVENT_STORES = {}
+
+def _get_event_store(site, timezone, EVENTS_DIR, start, end, period, voltage, ideal_battery = False, max_len=None, force_feasible=False, demand_name=""):
+    """ Return the event store, loading the event cache only once per process. """
+    key = (site, start, end, demand_name, period, voltage, ideal_battery, max_len, force_feasible)
+    if key not in _EVENT_STORES:
+        _EVENT_STORES[key] = _load_event_store(timezone, EVENTS_DIR, "_", start, end, period, voltage, ideal_battery = ideal_battery, max_len=max_len, force_feasible=force_feasible, demand_name=demand_name)
+    return _EVENT_STORES[key]
+
+@contextmanager
+def _atomic_open(path, mode='w'):
+    """ Open a temporary file next to `path` and move it into place only once writing succeeded.
+
+    A crashed or killed writer therefore never leaves a truncated file at `path`.
+    """
+    dirname, basename = os.path.split(str(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=f'.{basename}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _to_timestamps(column, period):
+    """ Vectorized `_datetime_to_timestamp` for a column of datetimes. """
+    import pandas as pd
+    seconds = (pd.to_datetime(column, utc=True) - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(seconds=1)
+    return np.floor(seconds.to_numpy(dtype=float) / (60 * period)).astype(int)
+
+def _sessions_to_arrays(df, offset, period, max_battery_power, max_len=None, force_feasible=False):
+    """ Convert the session DataFrame into per-session NumPy arrays in simulation units.
+
+    Args:
+        df (pd.DataFrame): Sessions from acndata with estimated_departure and estimated_requested_energy columns.
+        offset (int): Simulation timestamp of the beginning of the simulation.
+        See _pandas_toEvent() for additional args.
+
+    Returns:
+        dict: Column name -> np.ndarray with one entry per session.
+    """
+    arrival   = _to_timestamps(df['connectionTime'], period) - offset
+    departure = _to_timestamps(df['disconnectTime'], period) - offset
+
+    if max_len is not None:
+        departure = np.minimum(departure, arrival + max_len)
+
+    delivered_energy = df['kWhDelivered'].to_numpy(dtype=float)
+    if force_feasible:
+        delivered_energy = np.minimum(delivered_energy, max_battery_power * (departure - arrival) * (period / 60))
+
+    return {
+        'arrival'                   : arrival,
+        'departure'                 : departure,
+        'delivered_energy'          : delivered_energy,
+        'station_id'                : df['spaceID'].to_numpy(dtype=str),
+        'session_id'                : df['sessionID'].to_numpy(dtype=str),
+        'estimated_departure'       : _to_timestamps(df['estimated_departure'], period) - offset,
+        'estimated_requested_energy': df['estimated_requested_energy'].to_numpy(dtype=float),
+    }
+
+def _arrays_to_evs(sessions, period, voltage, max_battery_power, battery_params=None):
+    """ Build EV objects from the arrays returned by _sessions_to_arrays. """
+    from acnportal.acnsim.models.ev import EV
+    from acnportal.acnsim.models.battery import Battery
+    if battery_params is None:
+        battery_params = {"type": Battery}
+    batt_kwargs = battery_params["kwargs"] if "kwargs" in battery_params else {}
 
-        if battery_params is None:
-            battery_params = {"type": Battery}
-        batt_kwargs = battery_params["kwargs"] if "kwargs" in battery_params else {}
+    evs = []
+    for arrival, departure, delivered_energy, station_id, session_id, estimated_departure, estimated_requested_energy in zip(
+        sessions['arrival'].tolist(), sessions['departure'].tolist(), sessions['delivered_energy'].tolist(),
+        sessions['station_id'].tolist(), sessions['session_id'].tolist(),
+        sessions['estimated_departure'].tolist(), sessions['estimated_requested_energy'].tolist()
+    ):
+        batt_type = battery_params["type"]
         if "capacity_fn" in battery_params:
             try:
                 cap, init = battery_params["capacity_fn"](
                     delivered_energy, departure - arrival, voltage, period
                 )
-            except:     
+            except:
                 print('cant find cap init change battery to ideal')
-                battery_params = {"type": Battery}
+                batt_type = Battery
                 cap = delivered_energy
                 init = 0
         else:
             cap = delivered_energy
             init = 0
-        batt = battery_params["type"](cap, init, max_battery_power, **batt_kwargs)
-
-        estimated_departure = _datetime_to_timestamp(d["estimated_departure"], period) - offset
-        estimated_requested_energy = d['estimated_requested_energy']
-
-        # delivered_energy_amp_periods = delivered_energy * 1000 * (60 / period) / voltage
-        return EV(arrival, departure, delivered_energy, station_id, session_id, batt, estimated_departure=estimated_departure, estimated_requested_energy=estimated_requested_energy)
+        batt = batt_type(cap, init, max_battery_power, **batt_kwargs)
+        evs.append(EV(arrival, departure, delivered_energy, station_id, session_id, batt, estimated_departure=estimated_departure, estimated_requested_energy=estimated_requested_energy))
+    return evs
 
-    """ Gather Events from ACN-Data with a local cache."""
+def _event_store_path(EVENTS_DIR, start, end, ideal_battery = False, max_len=None, force_feasible=False, demand_name=""):
+    """ Path of the cached event store, without extension. """
     event_name = f'{start.date()}_{end.date()}_{ideal_battery}_{force_feasible}_{max_len}_{demand_name}'
-    path = os.path.join(EVENTS_DIR, event_name + '.json')
+    return os.path.join(EVENTS_DIR, event_name)
+
+def _load_event_store(timezone, EVENTS_DIR, df, start, end, period, voltage, ideal_battery = False, max_len=None, force_feasible=False, demand_name=""):
+    """ Gather Events from ACN-Data with a local columnar cache."""
+    path = _event_store_path(EVENTS_DIR, start, end, ideal_battery=ideal_battery, max_len=max_len, force_feasible=force_feasible, demand_name=demand_name)
     print(path)
-    if os.path.exists(path):
-        print('File found in cache : Downloading...Event')
-        with open(path, 'r') as f:
-            return acnsim.EventQueue.from_json(f)
+    if EventStore.exists(path):
+        print('File found in cache : Loading...Event')
+        return EventStore.load(path)
+
+    from acnportal import acnsim
+    if os.path.exists(path + '.json'):
+        # cache written before the columnar format, convert it once
+        print('JSON event cache found : Migrating...Event')
+        with open(path + '.json', 'r') as f:
+            EventStore.from_event_queue(acnsim.EventQueue.from_json(f)).save(path)
+        return EventStore.load(path)
 
     """ Create event from df """
     offset = acnsim.events.acndata_events._datetime_to_timestamp(start, period)
 
-    columns_backtoEV = ['_id', 'userInputs', 'userID', 'sessionID', 'stationID', 'spaceID', 'siteID',
-                        'clusterID', 'connectionTime', 'disconnectTime', 'kWhDelivered',
-                        'doneChargingTime', 'timezone','estimated_departure','estimated_requested_energy']
-    
-    docs = json.loads(df[columns_backtoEV].to_json(orient='records'))
-    for rec in docs:
-        rec['connectionTime'] = datetime.fromtimestamp(rec['connectionTime']/1000, tz=timezone)
-        rec['disconnectTime'] = datetime.fromtimestamp(rec['disconnectTime']/1000, tz=timezone)
-        rec['estimated_departure'] = datetime.fromtimestamp(rec['estimated_departure']/1000, tz=timezone)
-
     default_battery_power = 6.656
     if ideal_battery:
         battery_params=None
     else:
+        # imported here since battery_cache itself depends on this module
+        from battery_cache import BatteryCapacityCache
+        capacity_cache = BatteryCapacityCache(os.path.join(EVENTS_DIR, 'batt_cap_cache.json'))
         battery_params={'type': acnsim.Linear2StageBattery,
-                        'capacity_fn': acnsim.models.battery.batt_cap_fn}
+                        'capacity_fn': capacity_cache}
 
-    evs = []
-    for d in docs:
-        evs.append(
-            _convert_to_ev_with_estimated(
-                d,
-                offset,
-                period,
-                voltage,
-                default_battery_power,
-                max_len = max_len,
-                battery_params = battery_params,
-                force_feasible = force_feasible
-            )
-        )
-
-    events = [PluginEvent(sess.arrival, sess) for sess in evs]
-    eventQueue = EventQueue(events)
+    sessions = _sessions_to_arrays(df, offset, period, default_battery_power, max_len=max_len, force_feasible=force_feasible)
+    evs      = _arrays_to_evs(sessions, period, voltage, default_battery_power, battery_params=battery_params)
+    if not ideal_battery:
+        capacity_cache.report()
+        capacity_cache.save()
 
     # save to cache
     if not os.path.exists(EVENTS_DIR):
         os.mkdir(EVENTS_DIR)
-    with open(path, 'w') as f:
-        eventQueue.to_json(f)
-        print('Saving eventQueue to cache')
+    EventStore.from_evs(evs).save(path)
+    print('Saving events to cache')
 
-    return eventQueue 
\ No newline at end of file
+    return EventStore.load(path)
+
+def _pandas_toEvent(timezone, EVENTS_DIR, df, start, end, period, voltage, ideal_battery = False, max_len=None, force_feasible=False, demand_name=""):
+    """ Gather Events from ACN-Data with a local cache and return them as an EventQueue."""
+    return _load_event_store(timezone, EVENTS_DIR, df, start, end, period, voltage, ideal_battery = ideal_battery, max_len=max_len, force_feasible=force_feasible, demand_name=demand_name).to_event_queue()
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+import templates
+from analytics import RunStack
+
+
+def _no_events(row):
+    raise ValueError('no events')
+
+
+def test_summary_prices_each_run_at_its_own_revenue():
+    station_ids = templates.network('jpl').station_ids[:3]
+    runs = pd.DataFrame({'scenario': 'S', 'alg': 'EDF', 'start': '2019-10-01', 'end': '2019-10-02',
+                         'tariff': 'sce_tou_ev_4_march_2019', 'revenue': ['0.3', '0.5'], 'path': ['a', 'b'],
+                         'total_energy_requested': 100.0, 'proportion_delivered': 50.0, 'demands_fully_met': 50.0})
+    rates = np.zeros((2, 3, 288), dtype=np.float32)
+    rates[:, :, 100:120] = 16
+    df = RunStack(runs, rates, np.asarray(station_ids), 5, 'jpl').summary(events_fn=_no_events)
+
+    assert list(df['revenue']) == ['0.3', '0.5']
+    energy = df['total_energy_delivered']
+    np.testing.assert_allclose(df['revenue_usd'], energy * [0.3, 0.5])
+    np.testing.assert_allclose(df['profit'], energy * [0.3, 0.5] - df['total_cost'])
+    assert df.groupby('revenue')['profit'].mean().idxmax() == '0.5'
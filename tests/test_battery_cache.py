@@ -0,0 +1,34 @@
+import pytest
+from acnportal.acnsim.models.battery import batt_cap_fn
+
+from battery_cache import BatteryCapacityCache
+
+SESSIONS = [(4.918528, 96, 208, 5), (6.281438, 60, 208, 5), (6.281438, 60, 208, 5), (12.5, 30, 208, 5),
+            (23.99, 200, 208, 15), (75.0, 2, 208, 5)]
+
+
+def _fit(energy, stay, voltage, period):
+    try:
+        return tuple(float(value) for value in batt_cap_fn(energy, stay, voltage, period))
+    except ValueError:
+        return None
+
+
+def _cached(cache, energy, stay, voltage, period):
+    try:
+        return cache(energy, stay, voltage, period)
+    except ValueError:
+        return None
+
+
+def test_cache_returns_the_fits_of_batt_cap_fn(tmp_path):
+    cache = BatteryCapacityCache(str(tmp_path / 'batt_cap_cache.json'))
+    for session in SESSIONS:
+        assert _cached(cache, *session) == _fit(*session)
+    assert cache.hits == 1
+    cache.save()
+
+    reloaded = BatteryCapacityCache(str(tmp_path / 'batt_cap_cache.json'), capacity_fn=None)
+    for session in SESSIONS:
+        assert _cached(reloaded, *session) == _fit(*session)
+    assert reloaded.misses == 0
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import numpy as np
+from acnportal import acnsim
+from acnportal.algorithms import BaseAlgorithm
+from acnportal.signals.tariffs import TimeOfUseTariff
+
+from schedule_reuse import ScheduleReuse
+
+
+class DayAndPriceCap(BaseAlgorithm):
+    """ Charges every session as fast as a cap allows that depends on the current day and ToU price. """
+    def schedule(self, active_sessions):
+        interface   = self.interface
+        day         = interface.current_time // (24 * 60 // interface.period)
+        price       = interface.get_prices(1)[0]
+        cap         = (16 if day % 2 == 0 else 8) * (0.5 if price > 0.07 else 1)
+        horizon     = max([s.remaining_time for s in active_sessions], default=1)
+        schedule    = {station_id: np.zeros(horizon) for station_id in interface.infrastructure_info().station_ids}
+        for s in active_sessions:
+            need = interface.remaining_amp_periods(s)
+            schedule[s.station_id][:s.remaining_time] = np.clip(need - cap * np.arange(s.remaining_time), 0, cap)
+        return schedule
+
+
+def test_reused_tail_matches_a_fresh_solve():
+    network = acnsim.sites.caltech_acn(basic_evse=True)
+    events  = acnsim.EventQueue()
+    # charging across the 08:00 price change of the first day and across midnight
+    for k, (arrival, departure) in enumerate([(80, 200), (270, 420)]):
+        ev = acnsim.EV(arrival, departure, 10, network.station_ids[k], f'session_{k}', acnsim.Battery(100, 0, 6.656))
+        events.add_event(acnsim.PluginEvent(arrival, ev))
+    alg = DayAndPriceCap()
+    alg.max_recompute = 1
+    sim = acnsim.Simulator(network, alg, events, datetime(2019, 10, 1), period=5, verbose=False,
+                           signals={'tariff': TimeOfUseTariff('sce_tou_ev_4_march_2019')})
+    reuse = ScheduleReuse.install(alg)
+
+    checked = []
+    reuse_tail = reuse._reuse
+    def compare_with_solve(interface, active_sessions, now):
+        tail = reuse_tail(interface, active_sessions, now)
+        if tail is not None:
+            fresh = DayAndPriceCap.schedule(alg, active_sessions)
+            for station_id, rates in tail.items():
+                np.testing.assert_allclose(rates, fresh[station_id], atol=1e-6)
+            checked.append(now)
+        return tail
+    reuse._reuse = compare_with_solve
+    sim.run()
+
+    assert reuse.reuses == len(checked) > 0
+    assert 96 not in checked and 288 not in checked